@@ -1,5 +1,27 @@
 from codegen import Codebase
-from codegen.extensions.langchain.agent import create_codebase_agent
+from codegen.extensions.langchain.agent import create_agent_with_tools
+from codegen.extensions.langchain.tools import (
+    CommitTool,
+    CreateFileTool,
+    DeleteFileTool,
+    EditFileTool,
+    GithubCreatePRCommentTool,
+    GithubCreatePRReviewCommentTool,
+    GithubCreatePRTool,
+    GithubViewPRTool,
+    ListDirectoryTool,
+    MoveSymbolTool,
+    RenameFileTool,
+    RevealSymbolTool,
+    SearchTool,
+    SemanticEditTool,
+    SemanticSearchTool,
+    ViewFileTool,
+)
+from langchain_core.callbacks import BaseCallbackHandler
+from jobs import JobCancelled
+from tools import close_session, shell_tools
+from tracing import add_usage
 
 from dotenv import load_dotenv
 import uuid
@@ -7,16 +29,77 @@ import os
 
 load_dotenv()
 
+
+class UsageCallback(BaseCallbackHandler):
+    """Counts the agent's model tokens and tool calls against the current request."""
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        add_usage('openai_input_tokens', usage.get('prompt_tokens', 0))
+        add_usage('openai_output_tokens', usage.get('completion_tokens', 0))
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        add_usage('agent_tool_calls')
+
+
+class CancelCallback(BaseCallbackHandler):
+    """Stops the agent before its next model or tool call once the job is cancelled."""
+    raise_error = True
+
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def _check(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._check()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._check()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self._check()
+
+
+def codebase_tools(codebase: Codebase) -> list:
+    """The tools create_codebase_agent gives its agent."""
+    return [
+        ViewFileTool(codebase),
+        ListDirectoryTool(codebase),
+        SearchTool(codebase),
+        EditFileTool(codebase),
+        CreateFileTool(codebase),
+        DeleteFileTool(codebase),
+        RenameFileTool(codebase),
+        MoveSymbolTool(codebase),
+        RevealSymbolTool(codebase),
+        SemanticEditTool(codebase),
+        SemanticSearchTool(codebase),
+        CommitTool(codebase),
+        GithubCreatePRTool(codebase),
+        GithubViewPRTool(codebase),
+        GithubCreatePRCommentTool(codebase),
+        GithubCreatePRReviewCommentTool(codebase),
+    ]
+
+
 class CodeflowAgent:
-    def __init__(self, repo_path=None):
+    def __init__(self, repo_path=None, codebase=None):
         self.repo_path = repo_path or 'demo'
-        self.codebase = Codebase(self.repo_path)
-        self.agent = create_codebase_agent(
+        # An already parsed codebase (see codebase_index.py) skips the parse.
+        self.codebase = codebase or Codebase(self.repo_path)
+        # The worktree is leased to one job at a time, so its path keys a shell no other job shares.
+        self.shell_session = os.path.abspath(self.repo_path)
+        self.agent = create_agent_with_tools(
             codebase=self.codebase,
+            tools=codebase_tools(self.codebase) + shell_tools(self.shell_session, self.repo_path),
             model_name="gpt-4o",
             temperature=0,
             verbose=True,
         )
+        self.sessions: list[str] = []
     
     # def validate_output(self, session_id: str) -> bool:
     #     prompt = "If you edited the code write test cases for the code in a tests.py file"
@@ -39,7 +122,7 @@ class CodeflowAgent:
         
         
         
-    def run(self) -> str:
+    def run(self, session_id: str | None = None, cancelled=None) -> str:
         # Extract important information from repository
         config_path = os.path.join(self.repo_path, "codefusion.config")
 
@@ -50,16 +133,37 @@ class CodeflowAgent:
         
         print(input)
 
-        session_id = uuid.uuid4()
-        result = self.agent.invoke(
-            {
-                "input": input,
-            },
-            config={"configurable": {"session_id": session_id}}
-        )
-        
+        # create_agent_with_tools keeps one history for every session id, so a new session id
+        # alone would still replay the previous job's conversation; clear it first.
+        self.reset()
+        session_id = session_id or str(uuid.uuid4())
+        self.sessions.append(session_id)
+        callbacks = [UsageCallback()] + ([CancelCallback(cancelled)] if cancelled else [])
+        try:
+            result = self.agent.invoke(
+                {
+                    "input": input,
+                },
+                config={"configurable": {"session_id": session_id}, "callbacks": callbacks}
+            )
+        finally:
+            # The job's shell and background processes end with it; the next run starts a fresh shell.
+            close_session(self.shell_session)
+
         return result["output"]
 
+    def reset(self) -> None:
+        """
+        Drops the conversation history of past runs; `run()` does this before every run too.
+        The codebase is left alone: its edits are still to be pushed, and the codebase
+        index resets and syncs it before the next job.
+        """
+        get_session_history = getattr(self.agent, 'get_session_history', None)
+        if get_session_history:
+            for session_id in self.sessions:
+                get_session_history(session_id).clear()
+        self.sessions.clear()
+
 
 
 
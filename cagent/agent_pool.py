@@ -0,0 +1,54 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator
+
+from agent import CodeflowAgent
+from codebase_index import CODEBASE_INDEX_MAX_ENTRIES, codebase_index
+from dotenv import load_dotenv
+from repos import Workspace
+from tracing import span
+
+load_dotenv()
+
+# Agents hold on to their codebase, so by default the pool is no larger than the codebase index.
+AGENT_POOL_MAX_AGENTS = int(os.getenv('AGENT_POOL_MAX_AGENTS', CODEBASE_INDEX_MAX_ENTRIES))
+
+
+class AgentPool:
+    """
+    Warm CodeflowAgents keyed by worktree, so a repeat job on a repository skips
+    building the agent and its tool set. A leased agent's codebase is first synced
+    to the worktree's commit through the codebase index; if the index had to
+    re-parse, the agent is rebuilt around the new codebase. Agents are reset when
+    returned and evicted least recently used beyond `max_agents`.
+    """
+
+    def __init__(self, max_agents: int):
+        self.max_agents = max_agents
+        self._agents: OrderedDict[str, CodeflowAgent] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self, workspace: Workspace) -> Iterator[CodeflowAgent]:
+        """Hands out the workspace's agent exclusively for one job; the worktree lease already makes the path exclusive."""
+        with self._lock:
+            agent = self._agents.pop(workspace.path, None)
+        codebase = codebase_index.get(workspace)
+        if agent is None or agent.codebase is not codebase:
+            with span('agent_init'):
+                agent = CodeflowAgent(workspace.path, codebase)
+        else:
+            print(f"Reusing warm agent for {workspace.path}")
+
+        yield agent
+        # Not reached when the job raised: an agent in an unknown state is dropped rather than pooled.
+        agent.reset()
+        with self._lock:
+            self._agents[workspace.path] = agent
+            while len(self._agents) > self.max_agents:
+                self._agents.popitem(last=False)
+
+
+agent_pool = AgentPool(AGENT_POOL_MAX_AGENTS)
@@ -1,55 +1,82 @@
+import math
+
 from flask import Flask, request, jsonify
-import os
-import git
-from agent import CodeflowAgent
+from agent_pool import agent_pool
+from codebase_index import CODEBASE_PREWARM, codebase_index
 from dotenv import load_dotenv
+from jobs import Job, JobCancelled, job_queue
+from repos import repo_cache
+from tracing import instrument, span
 
 app = Flask(__name__)
-DEMO_DIR = 'demo'
+instrument(app)
 load_dotenv()
 
-# repo_url is the ssh URL of the repository
-def setup_repository(repo_url):
-    # Extract repository name from URL
-    repo_path = DEMO_DIR
+
+def process(repo_url: str, cancelled) -> dict:
+    # Each job gets its own worktree of the cached clone, so concurrent jobs never collide.
+    with repo_cache.checkout(repo_url) as workspace:
+        # Run a warm agent for this worktree, or build one
+        with agent_pool.lease(workspace) as agent, span('agent_run'):
+            result = agent.run(cancelled=cancelled)
+        if cancelled.is_set():
+            raise JobCancelled()  # never push the work of a cancelled job
+        with span('git_push'):
+            commit = repo_cache.commit_and_push(workspace, "Finished")
+    return {'result': result, 'commit': commit}
+
+
+def submit_job() -> tuple[Job | None, str | None]:
+    """Queues the job described by the request body; returns the job, or the reason the request is invalid."""
+    data = request.get_json(silent=True)
+    if not data or 'repository' not in data:
+        return None, 'Repository URL is required'
     try:
-        if os.path.exists(repo_path):
-            # Repository exists, pull latest changes
-            repo = git.Repo(repo_path)
-            repo.remotes.origin.pull()
-        else:
-            # Clone new repository
-            git.Repo.clone_from(repo_url, repo_path)
-    except Exception as e:
-        print(f'error {e}')
-    return repo_path
+        timeout = float(data['timeout']) if data.get('timeout') is not None else None
+    except (TypeError, ValueError):
+        timeout = math.nan
+    if timeout is not None and not 0 < timeout < math.inf:
+        return None, 'timeout must be a positive number of seconds'
+    # Jobs for the same repository run one at a time, in order.
+    return job_queue.submit(data['repository'], process, data['repository'], timeout=timeout), None
 
 
 @app.route('/process', methods=['POST'])
 def process_repository():
-    try:
-        data = request.get_json()
-        if not data or 'repository' not in data:
-            return jsonify({'error': 'Repository URL is required'}), 400
-
-        repo_url = data['repository']
-        repo_path = setup_repository(repo_url)
-        try:
-            # Create and run agent
-            agent = CodeflowAgent(repo_path)
-            result = agent.run()
-            os.system("./github.sh")
-            return jsonify({'result': result}), 200
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
-    
-    except FileNotFoundError as e:
-        return jsonify({'error': str(e)}), 404
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-            # Execute github.sh after processing
-    
+    job, error = submit_job()
+    if error:
+        return jsonify({'error': error}), 400
+    job.wait()
+    if job.status == 'failed':
+        return jsonify({'error': job.error, 'job_id': job.id}), 500
+    return jsonify({**job.result, 'job_id': job.id}), 200
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    job, error = submit_job()
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify({'job_id': job.id, 'status_url': f"/jobs/{job.id}"}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 202
+
 
 if __name__ == '__main__':
-    # Ensure demo directory exists
+    if CODEBASE_PREWARM:
+        codebase_index.prewarm(CODEBASE_PREWARM)
     app.run(debug=True, port=5003)
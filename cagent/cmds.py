@@ -1,33 +1,151 @@
+"""
+Runs the setup commands of a command file (by default demo/cmds.txt).
+
+Each non-empty line is a shell command. Plain lines run one after another, as
+before: each starts once the line above it has finished, whether or not it
+succeeded. A line can instead be named and given dependencies, which lets
+independent steps run concurrently:
+
+    install: pip install -r requirements.txt
+    lint (install): ruff check .
+    test (install): pytest -q
+    npm: npm ci
+
+`name: cmd` starts right away; `name (a, b): cmd` starts once steps a and b have
+succeeded, and is skipped (along with whatever depends on it) if either fails.
+Dependencies must be defined on earlier lines. Lines starting with # are ignored.
+
+    python cmds.py demo/cmds.txt --workers 4
+"""
+import argparse
+import re
 import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+_NAMED_LINE = re.compile(r'^([A-Za-z_][\w.-]*)\s*(?:\(([^)]*)\))?\s*:\s+(\S.*)$')
+_print_lock = threading.Lock()
+
+
+@dataclass
+class Step:
+    name: str
+    cmd: str
+    requires: list[str] = field(default_factory=list)  # must succeed first
+    after: list[str] = field(default_factory=list)     # must only have finished first
+    status: str = 'pending'  # pending | running | ok | failed | skipped
+    seconds: float = 0.0
+    returncode: int | None = None
+
+
+def parse_commands(lines: list[str]) -> list[Step]:
+    steps: dict[str, Step] = {}
+    previous = None
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        match = _NAMED_LINE.match(line)
+        if match:
+            name, deps, cmd = match.groups()
+            requires = [dep.strip() for dep in (deps or '').split(',') if dep.strip()]
+            unknown = [dep for dep in requires if dep not in steps]
+            if unknown:
+                raise ValueError(f"line {number}: {name} depends on undefined step(s) {', '.join(unknown)}")
+            if name in steps:
+                raise ValueError(f"line {number}: step {name} is defined twice")
+            step = Step(name, cmd, requires=requires)
+        else:
+            step = Step(f"line {number}", line, after=[previous] if previous else [])
+        steps[step.name] = step
+        previous = step.name
+    return list(steps.values())
+
 
-def execute_commands_from_file(file_path):
+def _emit(step: Step, text: str) -> None:
+    with _print_lock:
+        print(f"[{step.name}] {text}", flush=True)
+
+
+def run_step(step: Step) -> Step:
+    _emit(step, f"Executing command: {step.cmd}")
+    start = time.monotonic()
+    process = subprocess.Popen(step.cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors='replace')
+    for line in process.stdout:
+        _emit(step, line.rstrip('\n'))
+    step.returncode = process.wait()
+    step.seconds = time.monotonic() - start
+    step.status = 'ok' if step.returncode == 0 else 'failed'
+    if step.status == 'ok':
+        _emit(step, f"[SUCCESS] Command succeeded in {step.seconds:.1f}s: {step.cmd}")
+    else:
+        _emit(step, f"[ERROR] Command failed with exit code {step.returncode} after {step.seconds:.1f}s: {step.cmd}")
+    return step
+
+
+def run_steps(steps: list[Step], workers: int = 4) -> list[Step]:
+    """Runs every step whose dependencies allow it, up to `workers` at a time, in file order among the ready ones."""
+    by_name = {step.name: step for step in steps}
+    finished = ('ok', 'failed', 'skipped')
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for step in steps:
+                if step.status != 'pending':
+                    continue
+                if any(by_name[dep].status in ('failed', 'skipped') for dep in step.requires):
+                    step.status = 'skipped'
+                    _emit(step, f"[SKIPPED] A dependency failed: {step.cmd}")
+                elif len(running) < workers and all(by_name[dep].status == 'ok' for dep in step.requires) \
+                        and all(by_name[dep].status in finished for dep in step.after):
+                    step.status = 'running'
+                    running[pool.submit(run_step, step)] = step
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    step.status = 'failed'
+                    _emit(step, f"[ERROR] Could not run command: {e}")
+    return steps
+
+
+def print_summary(steps: list[Step], elapsed: float) -> None:
+    width = max((len(step.name) for step in steps), default=0)
+    print("\nSummary:")
+    for step in steps:
+        print(f"  {step.name:<{width}}  {step.status:<7}  {step.seconds:7.1f}s  {step.cmd}")
+    total = sum(step.seconds for step in steps)
+    print(f"Finished in {elapsed:.1f}s ({total:.1f}s of command time)")
+
+
+def execute_commands_from_file(file_path: str, workers: int = 4) -> bool:
     """
-    Reads each line from the given text file as a shell command, executes it,
-    and prints the output or error for each command.
-    
-    Parameters:
-      file_path (str): Path to the text file containing shell commands.
+    Runs the commands in the given file (see the module docstring for the format),
+    streaming their output, and prints a timing summary. Returns whether every command succeeded.
     """
     try:
         with open(file_path, 'r') as file:
-            # Get non-empty lines (stripped of whitespace)
-            commands = [line.strip() for line in file if line.strip()]
-    except Exception as e:
+            steps = parse_commands(file.readlines())
+    except (OSError, ValueError) as e:
         print(f"Error reading file {file_path}: {e}")
-        return
-
-    for cmd in commands:
-        print(f"\nExecuting command: {cmd}")
-        # Execute the command
-        process = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        # Check if the command ran successfully
-        if process.returncode != 0:
-            print(f"[ERROR] Command failed: {cmd}")
-            print(f"Error message: {process.stderr.strip()}")
-        else:
-            print(f"[SUCCESS] Command succeeded: {cmd}")
-            if process.stdout.strip():
-                print(f"Output: {process.stdout.strip()}")
+        return False
+
+    start = time.monotonic()
+    run_steps(steps, workers)
+    print_summary(steps, time.monotonic() - start)
+    return all(step.status == 'ok' for step in steps)
+
 
-# Example usage:
-execute_commands_from_file('demo/cmds.txt')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the commands of a command file")
+    parser.add_argument('file', nargs='?', default='demo/cmds.txt')
+    parser.add_argument('--workers', type=int, default=4, help="Commands run at the same time")
+    args = parser.parse_args()
+    sys.exit(0 if execute_commands_from_file(args.file, args.workers) else 1)
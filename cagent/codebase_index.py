@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import git
+from codegen import Codebase
+from codegen.sdk.codebase.config import CodebaseConfig
+from codegen.sdk.codebase.io.file_io import FileIO
+from codegen.shared.configs.models.feature_flags import CodebaseFeatureFlags
+from dotenv import load_dotenv
+from repos import Workspace
+from tracing import span
+
+load_dotenv()
+
+CODEBASE_INDEX_DB = os.getenv('CODEBASE_INDEX_DB', '.codebase_index.db')
+CODEBASE_INDEX_MAX_ENTRIES = int(os.getenv('CODEBASE_INDEX_MAX_ENTRIES', 4))
+# Beyond this many changed files a fresh parse is cheaper than syncing the graph.
+CODEBASE_MAX_INCREMENTAL_FILES = int(os.getenv('CODEBASE_MAX_INCREMENTAL_FILES', 200))
+# Number of recently used worktrees re-parsed in the background at startup.
+CODEBASE_PREWARM = int(os.getenv('CODEBASE_PREWARM', 0))
+
+# codegen's default config leaves graph sync off, and then `checkout()` only moves git.
+SYNCED_CONFIG = CodebaseConfig(feature_flags=CodebaseFeatureFlags(sync_enabled=True))
+
+
+class _WorktreeIO(FileIO):
+    """
+    codegen reads the files a graph sync adds by their repo-relative path, which
+    resolves against the process's working directory; this resolves them against the worktree.
+    """
+
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = Path(root).resolve()
+
+    def read_bytes(self, path: Path) -> bytes:
+        return super().read_bytes(path if path.is_absolute() else self.root / path)
+
+
+def parse_codebase(path: str) -> Codebase:
+    return Codebase(path, config=SYNCED_CONFIG, io=_WorktreeIO(path))
+
+
+@dataclass
+class _Entry:
+    codebase: Codebase
+    commit: str
+
+
+class CodebaseIndex:
+    """
+    Parsed codebases keyed by worktree, each tagged with the commit its graph
+    reflects. A worktree that comes back at a new commit is brought up to date with
+    `Codebase.checkout(commit=...)`, which re-parses only the files that changed
+    (codebases are parsed with graph sync enabled for this); a full parse happens
+    only for new worktrees, large jumps, or a sync that did not reach the commit.
+
+    codegen has no way to serialize a parsed graph, so parsed codebases live in
+    memory. What is persisted is a manifest of which worktrees were parsed at which
+    commit, which `prewarm()` uses to re-parse the most recent ones in the
+    background after a restart.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS codebases (
+                    path TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    commit_sha TEXT NOT NULL,
+                    parse_seconds REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _changed_files(self, path: str, old: str, new: str) -> int | None:
+        try:
+            return len(git.Repo(path).git.diff('--name-only', old, new).splitlines())
+        except git.GitCommandError:
+            return None  # e.g. the old commit was rewritten away
+
+    @staticmethod
+    def _synced_commit(codebase: Codebase) -> str | None:
+        commit = codebase.ctx.synced_commit
+        return commit.hexsha if commit is not None else None
+
+    def get(self, workspace: Workspace) -> Codebase:
+        """Returns the codebase of the workspace's worktree, synced to its current commit."""
+        with self._lock:
+            entry = self._entries.pop(workspace.path, None)
+
+        start = time.monotonic()
+        if entry and entry.commit != workspace.base_commit:
+            changed = self._changed_files(workspace.path, entry.commit, workspace.base_commit)
+            if changed is None or changed > CODEBASE_MAX_INCREMENTAL_FILES:
+                entry = None
+            else:
+                with span('codebase_sync'):
+                    # Undoes the previous job's edits in the graph, then applies the diff up to the new commit.
+                    entry.codebase.checkout(commit=workspace.base_commit)
+                if self._synced_commit(entry.codebase) != workspace.base_commit:
+                    print(f"Could not sync codebase {workspace.path} to {workspace.base_commit[:8]}, re-parsing")
+                    entry = None
+                else:
+                    print(f"Synced codebase {workspace.path} over {changed} changed files")
+        elif entry:
+            entry.codebase.reset()
+        if entry is None:
+            with span('codebase_parse'):
+                entry = _Entry(parse_codebase(workspace.path), workspace.base_commit)
+            print(f"Parsed codebase {workspace.path} in {time.monotonic() - start:.1f}s")
+        entry.commit = workspace.base_commit
+
+        with self._lock:
+            self._entries[workspace.path] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO codebases VALUES (?, ?, ?, ?, ?)',
+                (workspace.path, workspace.url, workspace.base_commit, time.monotonic() - start, time.time()),
+            )
+        return entry.codebase
+
+    def prewarm(self, limit: int) -> threading.Thread:
+        """Parses the `limit` most recently used worktrees that still exist, in a background thread."""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT path, commit_sha FROM codebases ORDER BY used_at DESC LIMIT ?', (limit,)).fetchall()
+
+        def warm():
+            for path, commit in rows:
+                if not os.path.exists(path):
+                    continue
+                with self._lock:
+                    if path in self._entries:
+                        continue
+                try:
+                    codebase = parse_codebase(path)
+                    head = git.Repo(path).head.commit.hexsha
+                except Exception as e:
+                    print(f"Could not prewarm {path}: {e}")
+                    continue
+                with self._lock:
+                    # A job that leased this worktree meanwhile has its own, newer entry.
+                    self._entries.setdefault(path, _Entry(codebase, head))
+                    self._entries.move_to_end(path, last=False)
+                print(f"Prewarmed codebase {path} at {head[:8]} (last used at {commit[:8]})")
+
+        thread = threading.Thread(target=warm, name='codebase-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+
+codebase_index = CodebaseIndex(CODEBASE_INDEX_DB, CODEBASE_INDEX_MAX_ENTRIES)
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+from tracing import trace
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_TIMEOUT = float(os.getenv('JOB_TIMEOUT', 30 * 60))
+JOB_TTL = float(os.getenv('JOB_TTL', 60 * 60))  # finished jobs are forgotten after this many seconds
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    key: str
+    timeout: float
+    status: str = 'queued'  # queued | running | done | failed
+    result: Any = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    # Set on cancellation or timeout; the running job checks it between agent steps.
+    cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+    cancel_reason: str | None = None
+    changed: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def cancel(self, reason: str = 'cancelled') -> None:
+        with self.changed:
+            if not self.finished and not self.cancelled.is_set():
+                self.cancel_reason = reason
+                self.cancelled.set()
+
+    def _finish(self, status: str, result: Any = None, error: str | None = None) -> None:
+        with self.changed:
+            self.status, self.result, self.error = status, result, error
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        with self.changed:
+            return self.changed.wait_for(lambda: self.finished, timeout=timeout)
+
+    def to_dict(self) -> dict:
+        with self.changed:
+            return {
+                'id': self.id,
+                'key': self.key,
+                'status': self.status,
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+class JobQueue:
+    """
+    Runs jobs on a bounded worker pool. Jobs sharing a key (the repository) run one
+    at a time in submission order, so their pushes land in order; jobs for different
+    keys run in parallel. A job that outlives its timeout is cancelled like one
+    cancelled through `cancel()`: at its next checkpoint.
+    """
+
+    def __init__(self, workers: int, timeout: float, ttl: float):
+        self.timeout = timeout
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs: dict[str, Job] = {}
+        self._pending: dict[str, deque[tuple[Job, Callable, tuple]]] = {}  # keys with a job submitted, and what waits behind it
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable[..., Any], *args, timeout: float | None = None) -> Job:
+        """Queues `fn(*args, cancelled=job.cancelled)` behind earlier jobs for `key`; its return value becomes the job result."""
+        job = Job(id=uuid.uuid4().hex, key=key, timeout=timeout or self.timeout)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+            if key in self._pending:
+                self._pending[key].append((job, fn, args))
+                return job
+            self._pending[key] = deque()
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Job | None:
+        """Cancels a job: a queued one never starts, a running one stops at its next checkpoint."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            waiting = self._pending.get(job.key, ())
+            queued = next((item for item in waiting if item[0] is job), None)
+            if queued:
+                waiting.remove(queued)
+        if queued:
+            job._finish('failed', error='cancelled')
+        else:
+            job.cancel()
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple) -> None:
+        with job.changed:
+            job.status = 'running'
+            job.started_at = time.time()
+        timer = threading.Timer(job.timeout, job.cancel, args=(f'timed out after {job.timeout:.0f}s',))
+        timer.daemon = True
+        timer.start()
+        try:
+            if job.cancelled.is_set():
+                raise JobCancelled()  # cancelled after it was taken off the queue but before a worker picked it up
+            with trace('job', job.id):
+                result = fn(*args, cancelled=job.cancelled)
+            job._finish('done', result=result)
+        except Exception as e:
+            error = job.cancel_reason if isinstance(e, JobCancelled) else str(e)
+            print(f"Job {job.id} failed: {error}")
+            job._finish('failed', error=error)
+        finally:
+            timer.cancel()
+            self._start_next(job.key)
+
+    def _start_next(self, key: str) -> None:
+        with self._lock:
+            waiting = self._pending[key]
+            if not waiting:
+                del self._pending[key]
+                return
+            job, fn, args = waiting.popleft()
+        self._executor.submit(self._run, job, fn, args)
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+job_queue = JobQueue(JOB_WORKERS, JOB_TIMEOUT, JOB_TTL)
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+import git
+from dotenv import load_dotenv
+from tracing import span
+
+load_dotenv()
+
+REPO_CACHE_DIR = os.getenv('REPO_CACHE_DIR', '.repos')
+REPO_CACHE_MAX_BYTES = int(os.getenv('REPO_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+
+
+@dataclass
+class Workspace:
+    """A leased worktree, reset to the tip of `branch` when handed out."""
+    url: str
+    key: str
+    path: str
+    branch: str
+    base_commit: str
+
+
+def repo_key(url: str) -> str:
+    name = re.sub(r'\.git$', '', url.rstrip('/').rsplit('/', 1)[-1].rsplit(':', 1)[-1])
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-{hashlib.sha256(url.encode()).hexdigest()[:10]}"
+
+
+def _disk_usage(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class RepoCache:
+    """
+    Working copies keyed by remote URL. Each remote is cloned once into a bare
+    mirror and refreshed with incremental fetches; jobs lease a worktree of it, so
+    concurrent jobs on one repository never share files. Worktrees are kept and
+    reset for the next lease instead of being recreated. Repositories without
+    active leases are evicted least recently used once the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+        self._locks: dict[str, threading.Lock] = {}
+        self._leases: dict[str, set[int]] = {}
+        self._guard = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS repos (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(os.path.join(self.root, 'repos.db'), timeout=30)
+
+    def _lock(self, key: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _mirror_path(self, key: str) -> str:
+        return os.path.join(self.root, 'mirrors', f'{key}.git')
+
+    def _worktree_path(self, key: str, slot: int) -> str:
+        return os.path.join(self.root, 'worktrees', key, str(slot))
+
+    def _sync_mirror(self, url: str, key: str) -> git.Repo:
+        path = self._mirror_path(key)
+        if os.path.exists(path):
+            mirror = git.Repo(path)
+        else:
+            mirror = git.Repo.clone_from(url, path, bare=True)
+            # A bare clone has no fetch refspec; track the remote's branches like a normal clone.
+            mirror.git.config('remote.origin.fetch', '+refs/heads/*:refs/remotes/origin/*')
+        mirror.git.fetch('origin', '--prune')
+        return mirror
+
+    def _lease_slot(self, key: str) -> int:
+        with self._guard:
+            leased = self._leases.setdefault(key, set())
+            slot = next(i for i in range(len(leased) + 1) if i not in leased)
+            leased.add(slot)
+            return slot
+
+    def _release_slot(self, key: str, slot: int) -> None:
+        with self._guard:
+            self._leases[key].discard(slot)
+
+    @contextmanager
+    def checkout(self, url: str, branch: str | None = None) -> Iterator[Workspace]:
+        """Leases a clean worktree of `url` at the latest commit of `branch` (default: the remote's default branch)."""
+        key = repo_key(url)
+        slot = self._lease_slot(key)
+        try:
+            # Fetching and adding worktrees touch the shared mirror, so they are serialized per repository.
+            with span('repo_sync'), self._lock(key):
+                mirror = self._sync_mirror(url, key)
+                branch = branch or mirror.git.symbolic_ref('--short', 'HEAD')
+                target = f'origin/{branch}'
+                path = self._worktree_path(key, slot)
+                if os.path.exists(os.path.join(path, '.git')):
+                    worktree = git.Repo(path)
+                    worktree.git.checkout('--detach', '--force', target)
+                    worktree.git.clean('-ffdx')
+                else:
+                    shutil.rmtree(path, ignore_errors=True)
+                    mirror.git.worktree('prune')
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    mirror.git.worktree('add', '--detach', '--force', path, target)
+                    worktree = git.Repo(path)
+                workspace = Workspace(url, key, path, branch, worktree.head.commit.hexsha)
+            yield workspace
+        finally:
+            self._release_slot(key, slot)
+            self._record_use(url, key)
+            self.evict()
+
+    def commit_and_push(self, workspace: Workspace, message: str) -> str | None:
+        """Commits every change in the worktree and pushes it to the workspace's branch. Returns the new commit, if any."""
+        worktree = git.Repo(workspace.path)
+        worktree.git.add('-A')
+        if not worktree.git.status('--porcelain'):
+            return None
+        worktree.git.commit('-m', message)
+        with self._lock(workspace.key):
+            worktree.git.push('origin', f'HEAD:refs/heads/{workspace.branch}')
+        return worktree.head.commit.hexsha
+
+    def _record_use(self, url: str, key: str) -> None:
+        if not os.path.exists(self._mirror_path(key)):
+            return  # the clone failed
+        size = _disk_usage(self._mirror_path(key)) + _disk_usage(os.path.join(self.root, 'worktrees', key))
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO repos VALUES (?, ?, ?, ?)', (key, url, size, time.time()))
+
+    def evict(self) -> None:
+        with self._connect() as conn:
+            rows = conn.execute('SELECT key, bytes FROM repos ORDER BY last_used').fetchall()
+        total = sum(size for _, size in rows)
+        for key, size in rows:
+            if total <= self.max_bytes:
+                return
+            lock = self._lock(key)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                with self._guard:
+                    if self._leases.get(key):
+                        continue
+                print(f"Evicting cached repository {key}")
+                shutil.rmtree(os.path.join(self.root, 'worktrees', key), ignore_errors=True)
+                shutil.rmtree(self._mirror_path(key), ignore_errors=True)
+                with self._connect() as conn:
+                    conn.execute('DELETE FROM repos WHERE key = ?', (key,))
+                total -= size
+            finally:
+                lock.release()
+
+
+repo_cache = RepoCache(REPO_CACHE_DIR, REPO_CACHE_MAX_BYTES)
@@ -0,0 +1,13 @@
+"""
+Run from cagent/: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The job modules open their stores at import time, so point them somewhere disposable first.
+_root = tempfile.mkdtemp(prefix='cagent-tests-')
+os.environ.setdefault('CODEBASE_INDEX_DB', os.path.join(_root, 'codebase_index.db'))
+os.environ.setdefault('REPO_CACHE_DIR', os.path.join(_root, 'repos'))
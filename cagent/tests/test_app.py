@@ -0,0 +1,30 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    timeouts = []
+
+    def submit(key, fn, *args, timeout=None):
+        timeouts.append(timeout)
+        return app_module.Job(id='job', key=key, timeout=timeout or 1)
+
+    monkeypatch.setattr(app_module.job_queue, 'submit', submit)
+    return timeouts
+
+
+@pytest.mark.parametrize('timeout', ['soon', -5, 0, 'nan', 'inf', [60]])
+def test_invalid_timeout_is_rejected(submitted, timeout):
+    response = app_module.app.test_client().post('/jobs', json={'repository': 'https://example.com/demo.git', 'timeout': timeout})
+    assert response.status_code == 400
+    assert 'timeout' in response.get_json()['error']
+    assert submitted == []
+
+
+def test_timeout_is_passed_to_the_job(submitted):
+    client = app_module.app.test_client()
+    assert client.post('/jobs', json={'repository': 'https://example.com/demo.git', 'timeout': '90'}).status_code == 202
+    assert client.post('/jobs', json={'repository': 'https://example.com/demo.git'}).status_code == 202
+    assert submitted == [90.0, None]
@@ -0,0 +1,47 @@
+import git
+import pytest
+
+from codebase_index import CodebaseIndex
+from repos import Workspace
+
+
+def _commit(repo: git.Repo, files: dict[str, str], message: str) -> str:
+    for name, content in files.items():
+        with open(f"{repo.working_tree_dir}/{name}", 'w') as f:
+            f.write(content)
+    repo.index.add(list(files))
+    return repo.index.commit(message).hexsha
+
+
+def _workspace(repo: git.Repo, commit: str) -> Workspace:
+    return Workspace(url='https://example.com/demo.git', key='demo', path=repo.working_tree_dir, branch='main', base_commit=commit)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = git.Repo.init(tmp_path / 'demo', initial_branch='main')
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'test')
+        config.set_value('user', 'email', 'test@example.com')
+    return repo
+
+
+def test_second_lease_sees_the_new_commit(repo, tmp_path):
+    first = _commit(repo, {'app.py': 'def old_name():\n    return 1\n'}, 'first')
+    index = CodebaseIndex(str(tmp_path / 'index.db'), max_entries=2)
+    codebase = index.get(_workspace(repo, first))
+    assert codebase.get_file('app.py').get_function('old_name') is not None
+
+    # What RepoCache does between two leases: the worktree moves to the branch's new tip.
+    second = _commit(repo, {
+        'app.py': 'def new_name():\n    return 2\n',
+        'helpers.py': 'def helper():\n    return 3\n',
+    }, 'second')
+    synced = index.get(_workspace(repo, second))
+
+    assert synced is codebase  # synced in place, not re-parsed
+    assert synced.ctx.synced_commit.hexsha == second
+    app = synced.get_file('app.py')
+    assert app.get_function('new_name') is not None
+    assert app.get_function('old_name') is None
+    assert synced.get_file('helpers.py').get_function('helper') is not None
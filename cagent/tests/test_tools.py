@@ -0,0 +1,33 @@
+import json
+import os
+
+from tools import _sessions, close_session, shell_tools
+
+
+def _call(tool, **args) -> dict:
+    return json.loads(tool.invoke(args))
+
+
+def test_sessions_are_kept_apart_and_closed(tmp_path):
+    (tmp_path / 'one' / 'src').mkdir(parents=True)
+    (tmp_path / 'two').mkdir()
+    run_one, status_one, _ = shell_tools('one', str(tmp_path / 'one'))
+    run_two, _, _ = shell_tools('two', str(tmp_path / 'two'))
+
+    assert _call(run_one, commands=['cd src'])['status'] == 'success'
+    assert _call(run_one, commands=['pwd'])['results'][0]['stdout'].strip() == str(tmp_path / 'one' / 'src')
+    assert _call(run_two, commands=['pwd'])['results'][0]['stdout'].strip() == str(tmp_path / 'two')
+
+    pid = _call(run_one, commands=['tail -f /dev/null'], is_background=True)['pids'][0]
+    assert _call(status_one, pid=pid)['running']
+    close_session('one')
+    close_session('two')
+
+    assert 'one' not in _sessions and 'two' not in _sessions
+    assert _call(status_one, pid=pid)['status'] == 'error'
+    try:
+        os.kill(pid, 0)
+        alive = True
+    except ProcessLookupError:
+        alive = False
+    assert not alive
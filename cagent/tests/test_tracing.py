@@ -0,0 +1,13 @@
+import os
+
+import pytest
+
+CAGENT_TRACING = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tracing.py')
+SERVER_TRACING = os.path.join(os.path.dirname(os.path.dirname(CAGENT_TRACING)), 'server', 'tracing.py')
+
+
+@pytest.mark.skipif(not os.path.exists(SERVER_TRACING), reason="cagent checked out without the server")
+def test_vendored_tracing_matches_the_server():
+    # The two services deploy separately, so each ships tracing.py; change both together.
+    with open(CAGENT_TRACING) as cagent, open(SERVER_TRACING) as server:
+        assert cagent.read() == server.read()
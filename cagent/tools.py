@@ -1,9 +1,25 @@
 """Tools for running bash commands."""
 
+import json
+import os
+import queue
 import re
 import shlex
+import signal
 import subprocess
-from typing import Any
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+# Per-command limits in a shell session
+COMMAND_TIMEOUT = float(os.getenv("SHELL_COMMAND_TIMEOUT", 60))
+MAX_OUTPUT_BYTES = int(os.getenv("SHELL_MAX_OUTPUT_BYTES", 64 * 1024))
+# Lines of output kept for each background process
+BACKGROUND_OUTPUT_LINES = int(os.getenv("SHELL_BACKGROUND_OUTPUT_LINES", 200))
 
 # Whitelist of allowed commands and their flags
 ALLOWED_COMMANDS = {
@@ -93,17 +109,241 @@ def validate_command(command: str) -> tuple[bool, str]:
         return False, f"Failed to validate command: {e!s}"
 
 
-def run_bash_command(commands: list[str], is_background: bool = False) -> dict[str, Any]:
-    """Run a bash command and return its output.
+class _Output:
+    """Output of one stream, capped at `limit` bytes."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.parts: list[str] = []
+        self.size = 0
+        self.truncated = False
+
+    def add(self, text: str) -> None:
+        size = len(text.encode(errors="replace"))
+        if self.size + size > self.limit:
+            self.truncated = True
+            text = text.encode(errors="replace")[: max(self.limit - self.size, 0)].decode(errors="ignore")
+            size = len(text.encode())
+        self.parts.append(text)
+        self.size += size
+
+    def text(self) -> str:
+        return "".join(self.parts) + ("\n[output truncated]" if self.truncated else "")
+
+
+class BackgroundProcess:
+    """A command started in the background, with the tail of its combined output."""
+
+    def __init__(self, command: str, cwd: str):
+        self.command = command
+        self.output: deque[str] = deque(maxlen=BACKGROUND_OUTPUT_LINES)
+        self.process = subprocess.Popen(
+            ["bash", "-c", command],
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            start_new_session=True,
+        )
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self) -> None:
+        for line in self.process.stdout:
+            self.output.append(line)
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def status(self) -> dict[str, Any]:
+        returncode = self.process.poll()
+        return {
+            "pid": self.pid,
+            "command": self.command,
+            "running": returncode is None,
+            "exit_code": returncode,
+            "output": "".join(self.output),
+        }
+
+    def kill(self) -> None:
+        if self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+
+
+class ShellSession:
+    """A long-lived bash process, so working directory changes carry over between commands.
+
+    Each command is followed by marker lines on stdout and stderr carrying its exit
+    code and the shell's working directory; output is collected until both markers
+    arrive. A command that times out takes the shell down with it, and the session
+    restarts a fresh shell in the last known working directory.
+    """
+
+    def __init__(self, cwd: str | None = None):
+        self.cwd = os.path.abspath(cwd or os.getcwd())
+        self.background: dict[int, BackgroundProcess] = {}
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self) -> None:
+        self._process = subprocess.Popen(
+            ["bash", "--noprofile", "--norc"],
+            cwd=self.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+            bufsize=1,
+            start_new_session=True,
+        )
+        # Each shell gets its own queue, so nothing left over from a killed shell leaks into the next command.
+        self._lines: queue.Queue[tuple[str, str | None]] = queue.Queue()
+        for name, stream in (("stdout", self._process.stdout), ("stderr", self._process.stderr)):
+            threading.Thread(target=self._read, args=(name, stream, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _read(name: str, stream, lines: queue.Queue) -> None:
+        for line in stream:
+            lines.put((name, line))
+        lines.put((name, None))
+
+    def _kill(self) -> None:
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._process.wait()
+
+    def run(
+        self,
+        command: str,
+        timeout: float = COMMAND_TIMEOUT,
+        max_output_bytes: int = MAX_OUTPUT_BYTES,
+        on_output: Callable[[str, str], None] | None = None,
+    ) -> dict[str, Any]:
+        """Run one command in the session.
+
+        Args:
+            command: The command to run
+            timeout: Seconds before the command is killed
+            max_output_bytes: Cap on the stdout and stderr returned, each
+            on_output: Called with (stream, line) as output arrives
+
+        Returns:
+            Dictionary with the exit code (None on timeout), stdout, stderr and whether the command timed out
+        """
+        marker = f"__codefusion_{uuid.uuid4().hex}__"
+        stdout, stderr = _Output(max_output_bytes), _Output(max_output_bytes)
+        with self._lock:
+            if self._process.poll() is not None:
+                self._start()
+            # Commands read from /dev/null, as stdin is the script the shell is reading.
+            self._process.stdin.write(
+                f"{command} < /dev/null\n"
+                f"__rc=$?\n"
+                f"printf '%s %d %s\\n' '{marker}' \"$__rc\" \"$PWD\"\n"
+                f"printf '%s\\n' '{marker}' >&2\n"
+            )
+            self._process.stdin.flush()
+
+            exit_code = None
+            pending = {"stdout", "stderr"}
+            deadline = time.monotonic() + timeout
+            while pending:
+                try:
+                    name, line = self._lines.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if line is None:
+                    break  # the shell exited, e.g. the command was `exit`
+                output = stdout if name == "stdout" else stderr
+                if marker in line:
+                    # Output without a trailing newline ends up on the marker's line.
+                    line, status = line.split(marker, 1)
+                    if name == "stdout":
+                        code, _, cwd = status.strip().partition(" ")
+                        exit_code, self.cwd = int(code), cwd
+                    pending.discard(name)
+                if line:
+                    output.add(line)
+                    if on_output:
+                        on_output(name, line)
+
+            timed_out = bool(pending) and self._process.poll() is None
+            if pending:
+                self._kill()
+                self._start()
+        return {
+            "command": command,
+            "exit_code": exit_code,
+            "stdout": stdout.text(),
+            "stderr": stderr.text(),
+            "timed_out": timed_out,
+        }
+
+    def start_background(self, command: str) -> BackgroundProcess:
+        process = BackgroundProcess(command, self.cwd)
+        self.background[process.pid] = process
+        return process
+
+    def close(self) -> None:
+        for process in self.background.values():
+            process.kill()
+        self.background.clear()
+        with self._lock:
+            self._kill()
+
+
+_sessions: dict[str, ShellSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(session_id: str = "default", cwd: str | None = None) -> ShellSession:
+    """Return the shell session for `session_id`, starting it in `cwd` if it doesn't exist yet."""
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            session = _sessions[session_id] = ShellSession(cwd)
+        return session
+
+
+def close_session(session_id: str) -> None:
+    """Stop a session's shell and its background processes."""
+    with _sessions_lock:
+        session = _sessions.pop(session_id, None)
+    if session:
+        session.close()
+
+
+def run_bash_command(
+    commands: list[str],
+    is_background: bool = False,
+    session_id: str = "default",
+    timeout: float = COMMAND_TIMEOUT,
+    on_output: Callable[[str, str], None] | None = None,
+    cwd: str | None = None,
+) -> dict[str, Any]:
+    """Run a batch of bash commands in a persistent shell session and return their output.
+
+    Commands run in order and the batch stops at the first failure; `cd` carries over
+    to later commands and later calls in the same session.
 
     Args:
-        command: The command to run
-        is_background: Whether to run the command in the background
+        commands: The commands to run
+        is_background: Whether to start the commands as background processes
+        session_id: The shell session to run in
+        timeout: Seconds each command may run
+        on_output: Called with (stream, line) as output arrives
+        cwd: Where the session's shell starts, if the session is new
 
     Returns:
-        Dictionary containing the command output or error
+        Dictionary with the per-command results, or an error
     """
-    # First validate the command
+    # Validate the whole batch before running any of it
     for command in commands:
         is_valid, error_message = validate_command(command)
         if not is_valid:
@@ -113,43 +353,111 @@ def run_bash_command(commands: list[str], is_background: bool = False) -> dict[s
             }
 
     try:
+        session = get_session(session_id, cwd)
         if is_background:
-            # For background processes, we use Popen and return immediately
-            process = subprocess.Popen(
-                command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
+            processes = [session.start_background(command) for command in commands]
             return {
                 "status": "success",
-                "message": f"Command '{command}' started in background with PID {process.pid}",
+                "message": "; ".join(f"Command '{p.command}' started in background with PID {p.pid}" for p in processes),
+                "pids": [p.pid for p in processes],
             }
 
-        # For foreground processes, we wait for completion
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=True,  # This will raise CalledProcessError if command fails
-        )
+        results = []
+        for command in commands:
+            result = session.run(command, timeout=timeout, on_output=on_output)
+            results.append(result)
+            if result["timed_out"]:
+                return {
+                    "status": "error",
+                    "error": f"Command '{command}' timed out after {timeout:.0f}s",
+                    "results": results,
+                }
+            if result["exit_code"] != 0:
+                return {
+                    "status": "error",
+                    "error": f"Command '{command}' failed with exit code {result['exit_code']}",
+                    "results": results,
+                }
 
         return {
             "status": "success",
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-        }
-    except subprocess.CalledProcessError as e:
-        return {
-            "status": "error",
-            "error": f"Command failed with exit code {e.returncode}",
-            "stdout": e.stdout,
-            "stderr": e.stderr,
+            "results": results,
+            "cwd": session.cwd,
         }
     except Exception as e:
         return {
             "status": "error",
             "error": f"Failed to run command: {e!s}",
         }
+
+
+def get_background_process(pid: int, session_id: str = "default") -> dict[str, Any]:
+    """Return the state and recent output of a background process.
+
+    Args:
+        pid: The PID returned when the process was started
+        session_id: The shell session that started it
+
+    Returns:
+        Dictionary with the process status, or an error
+    """
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+    process = session and session.background.get(pid)
+    if process is None:
+        return {"status": "error", "error": f"No background process with PID {pid}"}
+    return {"status": "success", **process.status()}
+
+
+def kill_background_process(pid: int, session_id: str = "default") -> dict[str, Any]:
+    """Kill a background process and return its final state.
+
+    Args:
+        pid: The PID returned when the process was started
+        session_id: The shell session that started it
+
+    Returns:
+        Dictionary with the process status, or an error
+    """
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+    process = session and session.background.pop(pid, None)
+    if process is None:
+        return {"status": "error", "error": f"No background process with PID {pid}"}
+    process.kill()
+    return {"status": "success", **process.status()}
+
+
+def shell_tools(session_id: str, cwd: str) -> list[BaseTool]:
+    """LangChain tools for an agent that run in the shell session `session_id`, started in `cwd`."""
+
+    def run_bash(commands: list[str], is_background: bool = False) -> str:
+        """Run bash commands in a persistent shell, in order, stopping at the first failure. `cd` carries over to later commands and calls.
+
+        Args:
+            commands: The commands to run
+            is_background: Start the commands as background processes and return their PIDs
+        """
+        return json.dumps(run_bash_command(commands, is_background, session_id=session_id, cwd=cwd), indent=2)
+
+    def background_process(pid: int) -> str:
+        """Get the state and recent output of a background process started with run_bash_command.
+
+        Args:
+            pid: The PID returned when the process was started
+        """
+        return json.dumps(get_background_process(pid, session_id), indent=2)
+
+    def kill_background(pid: int) -> str:
+        """Kill a background process started with run_bash_command.
+
+        Args:
+            pid: The PID returned when the process was started
+        """
+        return json.dumps(kill_background_process(pid, session_id), indent=2)
+
+    return [
+        StructuredTool.from_function(run_bash, name="run_bash_command", parse_docstring=True),
+        StructuredTool.from_function(background_process, name="get_background_process", parse_docstring=True),
+        StructuredTool.from_function(kill_background, name="kill_background_process", parse_docstring=True),
+    ]
@@ -0,0 +1,166 @@
+import contextvars
+import functools
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+from flask import Flask, Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, Counter as PromCounter, Histogram, generate_latest
+
+# Requests slower than this are logged with their per-stage breakdown (and profiled, see below).
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 30))
+# Fraction of requests run under pyinstrument (installed separately); a profile of the
+# request thread is only written when the request turns out slow.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram('codefusion_stage_seconds', 'Time spent in a pipeline stage', ['stage', 'status'], buckets=_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    'codefusion_request_seconds', 'HTTP request latency', ['endpoint', 'method', 'status'], buckets=_BUCKETS
+)
+USAGE = PromCounter('codefusion_usage', 'Billable usage: model tokens, scrapes, embedding inputs', ['kind'])
+
+
+@dataclass
+class Trace:
+    """Spans and usage of one request or job; shared by every thread working on it."""
+    request_id: str
+    name: str
+    started: float = field(default_factory=time.perf_counter)
+    stages: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    usage: Counter = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def summary(self) -> str:
+        with self.lock:
+            stages = ', '.join(
+                f"{stage} {sum(times):.2f}s" + (f" x{len(times)}" if len(times) > 1 else '')
+                for stage, times in self.stages.items()
+            )
+            usage = ', '.join(f"{kind}={count}" for kind, count in self.usage.items())
+        return f"[{self.request_id}] {self.name} {time.perf_counter() - self.started:.2f}s: {stages}" + (f" | {usage}" if usage else '')
+
+
+_current: contextvars.ContextVar[Trace | None] = contextvars.ContextVar('trace', default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Times a pipeline stage into the stage histogram and the current request's trace."""
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage, status).observe(elapsed)
+        trace = _current.get()
+        if trace:
+            with trace.lock:
+                trace.stages[stage].append(elapsed)
+
+
+def traced(stage: str) -> Callable:
+    """Decorator form of `span`."""
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def add_usage(kind: str, amount: int = 1) -> None:
+    """Counts billable usage globally and against the current request."""
+    if not amount:
+        return
+    USAGE.labels(kind).inc(amount)
+    trace = _current.get()
+    if trace:
+        with trace.lock:
+            trace.usage[kind] += amount
+
+
+def in_context(fn: Callable) -> Callable:
+    """Binds `fn` to the caller's trace, for work handed to thread pools."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+@contextmanager
+def trace(name: str, request_id: str | None = None) -> Iterator[Trace]:
+    """Starts a trace for work outside a Flask request (e.g. a background job) and logs it when done."""
+    current = Trace(request_id or uuid.uuid4().hex[:12], name)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+        print(current.summary())
+
+
+def instrument(app: Flask) -> None:
+    """
+    Gives every request an id (honouring X-Request-Id), a trace and latency metrics, and serves /metrics.
+    Calling it again for the same app (a module re-imported by the debug reloader) is a no-op.
+    """
+    if app.extensions.get('tracing'):
+        return
+    app.extensions['tracing'] = True
+
+    @app.before_request
+    def start_trace():
+        # Caller-supplied ids end up in log lines and profile file names, so only plain ones are kept.
+        request_id = request.headers.get('X-Request-Id', '')
+        if not re.fullmatch(r'[\w.-]{1,64}', request_id):
+            request_id = uuid.uuid4().hex[:12]
+        g.trace = Trace(request_id, f"{request.method} {request.path}")
+        g.trace_token = _current.set(g.trace)
+        g.profiler = None
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            from pyinstrument import Profiler
+            g.profiler = Profiler()
+            g.profiler.start()
+
+    @app.after_request
+    def finish_trace(response: Response) -> Response:
+        current = g.get('trace')
+        if current is None or request.path == '/metrics':
+            return response
+        elapsed = time.perf_counter() - current.started
+        REQUEST_SECONDS.labels(request.url_rule.rule if request.url_rule else 'unmatched', request.method, response.status_code).observe(elapsed)
+        response.headers['X-Request-Id'] = current.request_id
+        if g.profiler:
+            g.profiler.stop()
+            if elapsed >= SLOW_REQUEST_SECONDS:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                path = os.path.join(PROFILE_DIR, f"{current.request_id}.html")
+                with open(path, 'w') as f:
+                    f.write(g.profiler.output_html())
+                print(f"[{current.request_id}] profile written to {path}")
+        if elapsed >= SLOW_REQUEST_SECONDS or current.stages:
+            print(current.summary())
+        return response
+
+    @app.teardown_request
+    def reset_trace(error=None):
+        token = g.pop('trace_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
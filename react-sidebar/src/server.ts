@@ -5,6 +5,15 @@ import * as vscode from "vscode";
 
 const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
 
+const STAGE_LABELS: { [stage: string]: string } = {
+    video_summary: "Video analyzed",
+    url_ingested: "Docs ingested",
+    instructions: "Instructions ready",
+};
+
+// Give up on a video job that hasn't finished after this long.
+const JOB_TIMEOUT_MS = 15 * 60 * 1000;
+
 async function dispatchVideo(filePath: string): Promise<any> {
 
     const formData = new FormData();
@@ -12,13 +21,45 @@ async function dispatchVideo(filePath: string): Promise<any> {
     const blob = new Blob([fileBuffer]);
     formData.append("video", blob, path.basename(filePath));
     try {
-        const response = await fetch("http://localhost:5002/respond", {
+        // Start a background job, then poll it so progress shows up while the pipeline runs.
+        const created = await fetch("http://localhost:5002/jobs", {
             method: "POST",
             body: formData,
         });
-        return await response.json();
+        if (!created.ok) {
+            throw new Error(`Could not start the job (HTTP ${created.status})`);
+        }
+        const { job_id: jobId } = await created.json();
+
+        let seenEvents = 0;
+        const deadline = Date.now() + JOB_TIMEOUT_MS;
+        while (true) {
+            if (Date.now() > deadline) {
+                throw new Error(`Job ${jobId} did not finish within ${JOB_TIMEOUT_MS / 60000} minutes`);
+            }
+            const polled = await fetch(`http://localhost:5002/jobs/${jobId}`);
+            if (!polled.ok) {
+                throw new Error(`Could not read job ${jobId} (HTTP ${polled.status})`);
+            }
+            const job = await polled.json();
+            for (const event of job.events.slice(seenEvents)) {
+                const detail = event.stage === "url_ingested" ? `: ${event.data.url}` : "";
+                vscode.window.setStatusBarMessage(`CodeFusion: ${STAGE_LABELS[event.stage] ?? event.stage}${detail}`, 5000);
+            }
+            seenEvents = job.events.length;
+
+            if (job.status === "done") {
+                return job.result;
+            }
+            if (job.status === "failed") {
+                throw new Error(job.error);
+            }
+            await sleep(2000);
+        }
     } catch (error) {
         console.error("Error dispatching video:", error);
+        vscode.window.showErrorMessage(`CodeFusion: ${error instanceof Error ? error.message : error}`);
+        throw error;
     }
 }
 
@@ -192,6 +233,9 @@ export class Server {
                         terminal.show();
                         terminal.sendText("git pull");
                     }
+                }).catch((error) => {
+                    // Already shown to the user by dispatchVideo; stop before committing or processing.
+                    console.error("Video pipeline stopped:", error);
                 });
 
                 return { success: true, message: "Git commands executed in terminal" };
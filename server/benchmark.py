@@ -0,0 +1,369 @@
+"""
+Offline end-to-end benchmark for the /respond pipeline.
+
+Every paid service is replaced by an in-process stand-in with configurable latency
+and error injection: Gemini (files + generate APIs) returns a canned VideoSummary,
+ScrapingBee serves the files in data/, OpenAI returns deterministic hashed embeddings
+and canned page summaries, and the vector store is the local backend. Token counts
+use an approximate encoding, so nothing is downloaded. Caches and stores live in a
+temporary directory. The pipeline code itself runs unmodified.
+
+    python benchmark.py --requests 40 --concurrency 8 --latency gemini=2 scrape=0.5 --errors scrape=0.05
+
+Prints a JSON report with per-stage p50/p95/p99 latency, throughput and peak memory.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from types import SimpleNamespace
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+BENCH_HOST = 'https://bench.local/'
+SERVICES = ('gemini', 'scrape', 'embed', 'summary', 'vector')
+
+
+class InjectedError(Exception):
+    pass
+
+
+@dataclass
+class Fault:
+    """Latency (seconds, with +/- `jitter` as a fraction) and error rate for one stand-in."""
+    latency: float = 0.0
+    jitter: float = 0.2
+    error_rate: float = 0.0
+
+    def apply(self, service: str) -> None:
+        if self.latency:
+            time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            raise InjectedError(f"injected {service} failure")
+
+
+@dataclass
+class Recorder:
+    """Thread-safe collection of (stage, seconds) samples."""
+    samples: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def timed(self, stage: str, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def hashed_embedding(text: str, dimension: int) -> list[float]:
+    """Deterministic bag-of-words embedding, so similar texts get similar vectors."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in text.lower().split():
+        h = zlib.crc32(word.encode('utf-8'))
+        vector[h % dimension] += 1.0 if h & 1 << 31 else -1.0
+    return vector.tolist()
+
+
+def _data_files() -> list[str]:
+    return sorted(f for f in os.listdir(DATA_DIR) if f.endswith(('.html', '.md')))
+
+
+def canned_summary(urls: list[str]):
+    from process_video import VideoSummary, VideoSummarySegment
+
+    segments = []
+    for i, url in enumerate(urls):
+        segments.append(VideoSummarySegment(
+            start_timestamp=6.0 * i, end_timestamp=6.0 * i + 3, user_speech="Let me check how streaming works in the docs.",
+            screen_events=[f"User opens the API reference at {url}", "User scrolls to the streaming section"],
+            active_files=['client.py'], visited_urls=[url],
+        ))
+        segments.append(VideoSummarySegment(
+            start_timestamp=6.0 * i + 3, end_timestamp=6.0 * i + 6, user_speech="",
+            screen_events=["User edits the request call in client.py to pass stream=True"],
+            active_files=['client.py'], visited_urls=[],
+        ))
+    return VideoSummary(
+        segments=segments,
+        overall_summary="The user reads API reference docs and edits client.py to stream completions.",
+        user_intention="Switch the completion request in client.py to streaming and print tokens as they arrive.",
+    )
+
+
+class FakeGemini:
+    """The subset of google.genai.Client used by process_video."""
+
+    def __init__(self, fault: Fault, default_urls: list[str], processing_polls: int = 1):
+        self.fault = fault
+        self.processing_polls = processing_polls
+        self.polls: dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+        # The canned summary of an upload visits the URLs of the request that uploaded it.
+        self.request = threading.local()
+        self.default_urls = default_urls
+        self.urls_by_file: dict[str, list[str]] = {}
+        self.files = SimpleNamespace(upload=self.upload, get=self.get, delete=lambda name: None)
+        self.models = SimpleNamespace(generate_content=self.generate_content, generate_content_stream=self.generate_content_stream)
+
+    def _file(self, name: str, state: str):
+        return SimpleNamespace(name=name, state=SimpleNamespace(name=state), expiration_time=None)
+
+    def upload(self, file, config=None):
+        self.fault.apply('gemini')
+        if hasattr(file, 'read'):
+            file.read()
+        name = f'files/{uuid.uuid4().hex}'
+        with self.lock:
+            self.urls_by_file[name] = getattr(self.request, 'urls', self.default_urls)
+        return self._file(name, 'PROCESSING' if self.processing_polls else 'ACTIVE')
+
+    def get(self, name: str):
+        with self.lock:
+            self.polls[name] += 1
+            done = self.polls[name] >= self.processing_polls
+        return self._file(name, 'ACTIVE' if done else 'PROCESSING')
+
+    def _summary(self, contents):
+        with self.lock:
+            urls = self.urls_by_file.get(contents[0].name, self.default_urls)
+        return canned_summary(urls)
+
+    def generate_content(self, model, contents, config=None):
+        self.fault.apply('gemini')
+        return SimpleNamespace(parsed=self._summary(contents))
+
+    def generate_content_stream(self, model, contents, config=None):
+        self.fault.apply('gemini')
+        text = self._summary(contents).model_dump_json()
+        for i in range(0, len(text), 256):
+            yield SimpleNamespace(text=text[i:i + 256])
+
+
+class ApproxEncoding:
+    """
+    Stands in for tiktoken's cl100k_base, whose BPE file would be downloaded on first
+    use: a token is every 4 characters, about the real average for English and code.
+    """
+
+    def encode(self, text: str, **kwargs) -> list[str]:
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens: list[str]) -> str:
+        return ''.join(tokens)
+
+
+class FakeOpenAI:
+    """The subset of openai.Client used for embeddings and page summaries."""
+
+    def __init__(self, embed_fault: Fault, summary_fault: Fault, dimension: int):
+        self.dimension = dimension
+        self.embed_fault, self.summary_fault = embed_fault, summary_fault
+        self.embeddings = SimpleNamespace(with_raw_response=SimpleNamespace(create=self.create_embeddings))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_completion))
+        self.usage = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def _count(self, **usage: int) -> None:
+        with self.lock:
+            for key, value in usage.items():
+                self.usage[key] += value
+
+    def create_embeddings(self, model, input):
+        self.embed_fault.apply('embed')
+        self._count(embedding_requests=1, embedding_inputs=len(input))
+        data = [SimpleNamespace(index=i, embedding=hashed_embedding(text, self.dimension)) for i, text in enumerate(input)]
+        return SimpleNamespace(headers={}, parse=lambda: SimpleNamespace(data=data))
+
+    def create_completion(self, model, messages):
+        self.summary_fault.apply('summary')
+        self._count(summary_requests=1)
+        url = messages[-1]['content'].split()[-2]
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=f"API reference documentation {url}"))],
+            usage=SimpleNamespace(prompt_tokens=40, completion_tokens=10),
+        )
+
+
+def fake_render(fault: Fault):
+    def render_html(url: str):
+        fault.apply('scrape')
+        name = url[len(BENCH_HOST):].split('?')[0]
+        with open(os.path.join(DATA_DIR, name)) as f:
+            text = f.read()
+        if not name.endswith('.html'):
+            text = f"<html><body><pre>{text}</pre></body></html>"
+        return SimpleNamespace(text=text, headers={})
+    return render_html
+
+
+def configure_environment(root: str) -> None:
+    """Points every store at `root` and selects the local vector backend, before the server modules load."""
+    os.environ.update({
+        'VECTOR_BACKEND': 'local',
+        'LOCAL_VECTOR_DIR': os.path.join(root, 'vector_store'),
+        'SCRAPE_CACHE_DIR': os.path.join(root, 'scrape_cache'),
+        'PAGE_INDEX_DB': os.path.join(root, 'page_index.db'),
+        'SUMMARY_DB': os.path.join(root, 'summaries.db'),
+        'VIDEO_CACHE_DB': os.path.join(root, 'video_cache.db'),
+        'RETRIEVAL_RERANK_MODEL': '',
+        'GEMINI_API_KEY': 'benchmark',
+        'OPENAI_API_KEY': 'benchmark',
+        'SCRAPINGBEE_API_KEY': 'benchmark',
+    })
+
+
+def install_fakes(faults: dict[str, Fault], recorder: Recorder, default_urls: list[str]) -> tuple[FakeGemini, FakeOpenAI]:
+    import clients
+    import context
+    import process_video
+    import run
+    import scrape
+    from embedding_scheduler import EmbeddingScheduler, ScheduledEmbeddings
+    from local_vector import LocalVectorStore
+
+    gemini = FakeGemini(faults['gemini'], default_urls)
+    process_video.client = gemini
+    openai_client = FakeOpenAI(faults['embed'], faults['summary'], clients.EMBEDDING_DIMENSION)
+    clients._openai_client = openai_client
+    encoding = ApproxEncoding()
+    clients._embeddings = ScheduledEmbeddings(EmbeddingScheduler(openai_client, encoding=encoding))
+    context._encoding = encoding
+    scrape.render_html = fake_render(faults['scrape'])
+
+    search = LocalVectorStore.similarity_search_with_score_by_vector
+
+    def slow_search(self, *args, **kwargs):
+        faults['vector'].apply('vector')
+        return search(self, *args, **kwargs)
+    LocalVectorStore.similarity_search_with_score_by_vector = slow_search
+
+    run.summarize_video = recorder.timed('video', run.summarize_video)
+    run.retrieve = recorder.timed('retrieve', run.retrieve)
+    run.format_instructions = recorder.timed('assemble', run.format_instructions)
+
+    class TimedIngestor(run.Ingestor):
+        def wait(self, *args, **kwargs):
+            return recorder.timed('ingest_wait', super().wait)(*args, **kwargs)
+    run.Ingestor = TimedIngestor
+    return gemini, openai_client
+
+
+def run_benchmark(args) -> dict:
+    faults = {service: Fault() for service in SERVICES}
+    for spec in args.latency:
+        service, value = spec.split('=')
+        faults[service].latency = float(value)
+    for spec in args.errors:
+        service, value = spec.split('=')
+        faults[service].error_rate = float(value)
+
+    with tempfile.TemporaryDirectory() as root:
+        configure_environment(root)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        files = _data_files()
+
+        def urls_for_request(i: int) -> list[str]:
+            # Cold runs give every request its own URLs, so no page cache is shared.
+            suffix = f'?r={i}' if args.cold else ''
+            return [f'{BENCH_HOST}{name}{suffix}' for name in files]
+
+        recorder = Recorder()
+        gemini, openai_client = install_fakes(faults, recorder, urls_for_request(0))
+        import run
+
+        def one_request(i: int) -> tuple[int, float]:
+            gemini.request.urls = urls_for_request(i)
+            payload = os.urandom(args.video_bytes) if args.cold else b'\0' * args.video_bytes
+            with run.app.test_client() as http:
+                start = time.perf_counter()
+                response = http.post('/respond', data={'video': (BytesIO(payload), 'bench.mp4')}, content_type='multipart/form-data')
+                elapsed = time.perf_counter() - start
+            recorder.record('total', elapsed)
+            return response.status_code, elapsed
+
+        for i in range(args.warmup):
+            one_request(-1 - i)
+        recorder.samples.clear()
+        openai_client.usage.clear()
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one_request, range(args.requests)))
+        wall = time.perf_counter() - start
+        peak_traced = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        tracemalloc.stop()
+
+    errors = sum(1 for status, _ in results if status != 200)
+    return {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'cold': args.cold,
+        'faults': {service: vars(fault) for service, fault in faults.items()},
+        'errors': errors,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(args.requests / wall, 3),
+        'stages': {
+            stage: {
+                'count': len(values),
+                'p50': round(percentile(values, 50), 4),
+                'p95': round(percentile(values, 95), 4),
+                'p99': round(percentile(values, 99), 4),
+                'max': round(max(values), 4),
+            }
+            for stage, values in recorder.samples.items() if values
+        },
+        'usage': dict(openai_client.usage),
+        'peak_traced_bytes': peak_traced,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark /respond against local stand-ins for every external service")
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=1, help="Requests run before measuring")
+    parser.add_argument('--cold', action='store_true', help="Unique recording and URLs per request, so caches never hit")
+    parser.add_argument('--video-bytes', type=int, default=1024 * 1024)
+    parser.add_argument('--latency', nargs='*', default=[], metavar='SERVICE=SECONDS', help=f"Services: {', '.join(SERVICES)}")
+    parser.add_argument('--errors', nargs='*', default=[], metavar='SERVICE=RATE')
+    parser.add_argument('--tracemalloc', action='store_true', help="Also report peak Python allocations (slows the run)")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = json.dumps(run_benchmark(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
@@ -0,0 +1,212 @@
+import argparse
+import os
+import re
+
+from langchain.docstore.document import Document
+
+CHUNK_MAX_CHARS = int(os.getenv('CHUNK_MAX_CHARS', 2000))
+# Part of every page version: bump it whenever chunk_markdown's output changes, so pages
+# indexed by an older chunker are re-chunked on their next ingestion.
+CHUNKER_VERSION = 2
+
+_LINK = re.compile(r'!?\[([^\]]*)\]\(([^)\s]*)(?:\s+"[^"]*")?\)')
+_IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+_ANCHOR = re.compile(r'\[[\s​]*\]\(#[^)]*\)')
+_ATX_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_FENCE = re.compile(r'^\s*(```|~~~)')
+_CHROME_LINES = {'was this page helpful?', 'on this page', 'search...', 'ctrl k', 'copy', 'copy page'}
+
+
+def _is_navigation(line: str) -> bool:
+    """Lines that are mostly links (sidebars, breadcrumbs, footers) carry no documentation."""
+    links = _LINK.findall(line)
+    if not links:
+        return False
+    visible = re.sub(r'\s', '', _LINK.sub(lambda m: m.group(1), line))
+    link_text = sum(len(re.sub(r'\s', '', text)) for text, _ in links)
+    is_list_item = re.match(r'^\s*([*+-]|\d+\.)\s', line) is not None
+    return link_text >= 0.5 * max(len(visible), 1) and (len(links) >= 2 or is_list_item or not visible)
+
+
+def strip_chrome(markdown: str) -> str:
+    """
+    Removes site navigation, images and heading anchors from markdownify output.
+    Code blocks are kept verbatim apart from the line-number gutter code viewers
+    render as a leading run of "1", "2", ... lines.
+    """
+    lines = []
+    in_code = False
+    gutter = None  # next expected gutter number at the top of a code block
+    for line in markdown.splitlines():
+        if _FENCE.match(line):
+            in_code = not in_code
+            gutter = 1 if in_code else None
+            lines.append(line)
+            continue
+        if in_code:
+            if gutter is not None and line.strip() == str(gutter):
+                gutter += 1
+                continue
+            gutter = None
+            lines.append(line)
+            continue
+        line = _ANCHOR.sub('', _IMAGE.sub('', line)).rstrip()
+        if _is_navigation(line) or line.strip().lower() in _CHROME_LINES:
+            continue
+        lines.append(line)
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def split_sections(markdown: str) -> list[tuple[list[str], str]]:
+    """Splits markdown at ATX and setext headings outside code blocks into (heading path, body) pairs."""
+    sections: list[tuple[list[str], list[str]]] = [([], [])]
+    path: list[tuple[int, str]] = []
+    lines = markdown.splitlines()
+    in_code = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _FENCE.match(line):
+            in_code = not in_code
+        heading = None
+        if not in_code:
+            atx = _ATX_HEADING.match(line)
+            next_line = lines[i + 1] if i + 1 < len(lines) else ''
+            if atx:
+                heading = (len(atx.group(1)), atx.group(2))
+            elif line.strip() and re.match(r'^(=+|-+)\s*$', next_line) and not re.match(r'^\s*([*+-]|\d+\.)\s', line):
+                heading = (1 if next_line.startswith('=') else 2, line.strip())
+                i += 1
+        if heading:
+            level, title = heading
+            path = [(l, t) for l, t in path if l < level] + [(level, title)]
+            sections.append(([t for _, t in path], []))
+        else:
+            sections[-1][1].append(line)
+        i += 1
+    return [(headings, '\n'.join(body).strip()) for headings, body in sections if '\n'.join(body).strip()]
+
+
+def _blocks(text: str) -> list[str]:
+    """Paragraphs and whole code blocks, in order."""
+    blocks, current, in_code = [], [], False
+    for line in text.splitlines():
+        if _FENCE.match(line):
+            in_code = not in_code
+        if not line.strip() and not in_code:
+            if current:
+                blocks.append('\n'.join(current))
+                current = []
+            continue
+        current.append(line)
+    if current:
+        blocks.append('\n'.join(current))
+    return blocks
+
+
+def _split_block(block: str, max_chars: int) -> list[str]:
+    if len(block) <= max_chars:
+        return [block]
+    pieces, current = [], ''
+    for line in block.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ''
+        current += line
+    if current:
+        pieces.append(current)
+    return [piece.rstrip('\n') for piece in pieces]
+
+
+def chunk_markdown(url: str, markdown: str, summary: str = '', max_chars: int = CHUNK_MAX_CHARS) -> list[Document]:
+    """
+    Chunks a page along its heading structure without overlap. Consecutive
+    sections are packed into a chunk up to `max_chars`; long sections are cut at
+    paragraph and code-block boundaries. Each chunk opens with the heading path of
+    its first section, while the URL and page summary go in metadata rather than
+    the text.
+    """
+    sections = split_sections(strip_chrome(markdown))
+    # When the page has a title heading, what precedes it is site chrome (sidebars, breadcrumbs).
+    first_title = next((i for i, (headings, _) in enumerate(sections) if headings and _is_title(markdown, headings[0])), None)
+    if first_title:
+        sections = sections[first_title:]
+
+    docs = []
+    chunk_headings: list[str] = []
+    text = ''
+
+    def flush():
+        nonlocal text
+        if text:
+            docs.append(Document(page_content=text, metadata={
+                'source': url,
+                'summary': summary,
+                'headings': ' > '.join(chunk_headings),
+            }))
+            text = ''
+
+    for headings, body in sections:
+        # Start a new chunk at a section boundary unless that would leave this one mostly empty.
+        if len(text) >= max_chars // 2 and len(text) + len(headings[-1] if headings else '') + len(body) + 4 > max_chars:
+            flush()
+        if not text:
+            # A chunk opens with the full path so it stands on its own.
+            chunk_headings = headings
+            title = ' > '.join(headings)
+        else:
+            title = headings[-1] if headings else ''
+        budget = max_chars - len(title) - 2
+        blocks = [b for raw in _blocks(body) for b in _split_block(raw, max(budget, max_chars // 2))]
+        piece = ''
+        for block in blocks:
+            if piece and len(text) + len(title) + len(piece) + len(block) + 6 > max_chars:
+                text = _join(text, title, piece)
+                flush()
+                chunk_headings, title = headings, ' > '.join(headings)
+                piece = ''
+            piece = f"{piece}\n\n{block}" if piece else block
+        text = _join(text, title, piece)
+    flush()
+    return docs
+
+
+def _join(text: str, title: str, body: str) -> str:
+    section = f"{title}\n\n{body}" if title else body
+    return f"{text}\n\n{section}" if text else section
+
+
+def _is_title(markdown: str, heading: str) -> bool:
+    """Whether `heading` appears in the page as a level-one heading."""
+    escaped = re.escape(heading)
+    return re.search(rf'^(#\s+.*{escaped}.*|.*{escaped}.*\n=+\s*)$', markdown, re.MULTILINE) is not None
+
+
+def compare(path: str) -> None:
+    """Prints stored rows and embedding tokens for the old splitter and this chunker on a markdown file."""
+    import tiktoken
+    from langchain.text_splitter import CharacterTextSplitter
+
+    encoding = tiktoken.get_encoding('cl100k_base')
+    with open(path) as f:
+        markdown = f.read()
+    old = CharacterTextSplitter(chunk_size=2000, chunk_overlap=500).split_text(markdown)
+    # The old chunks also carried the URL and a ~60 token summary in their text.
+    header = len(encoding.encode(f"Page Context: \n{path}\n")) + 60
+    old_tokens = sum(len(encoding.encode(chunk)) + header for chunk in old)
+    new = chunk_markdown(path, markdown)
+    new_tokens = sum(len(encoding.encode(doc.page_content)) for doc in new)
+    print(f"{path}: {len(old)} -> {len(new)} rows, {old_tokens} -> {new_tokens} embedding tokens")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the chunker against the previous splitter")
+    parser.add_argument('files', nargs='+', help="Markdown files, e.g. data/*.md")
+    for file in parser.parse_args().files:
+        compare(file)
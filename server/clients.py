@@ -0,0 +1,175 @@
+import os
+import queue
+import threading
+import time
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from typing import Iterator
+
+import dotenv
+import openai
+import sqlalchemy
+from embedding_scheduler import EmbeddingScheduler, ScheduledEmbeddings
+from langchain_iris import IRISVector
+from local_vector import LocalVectorStore
+
+dotenv.load_dotenv()
+
+COLLECTION_NAME = 'documentation'
+EMBEDDING_DIMENSION = 1536
+
+# 'iris' (InterSystems IRIS) or 'local' (in-process store under LOCAL_VECTOR_DIR).
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'iris')
+LOCAL_VECTOR_DIR = os.getenv('LOCAL_VECTOR_DIR', '.vector_store')
+
+# Idle connections older than this are pinged before being handed out again.
+HEALTHCHECK_INTERVAL = float(os.getenv('IRIS_HEALTHCHECK_SECONDS', 30))
+
+
+def connection_string() -> str:
+    username = 'demo'
+    password = 'demo'
+    hostname = os.getenv('IRIS_HOSTNAME', 'localhost')
+    port = '1972'
+    namespace = 'USER'
+    return f"iris://{username}:{password}@{hostname}:{port}/{namespace}"
+
+
+_lock = threading.Lock()
+_openai_client: openai.Client | None = None
+_embeddings: ScheduledEmbeddings | None = None
+
+
+def get_openai_client() -> openai.Client:
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            _openai_client = openai.Client()
+        return _openai_client
+
+
+def get_embeddings() -> ScheduledEmbeddings:
+    """Embeddings shared by the whole process, so concurrent pages are embedded in common batches."""
+    global _embeddings
+    client = get_openai_client()
+    with _lock:
+        if _embeddings is None:
+            _embeddings = ScheduledEmbeddings(EmbeddingScheduler(client))
+        return _embeddings
+
+
+def _create_store() -> IRISVector:
+    return IRISVector(
+        dimension=EMBEDDING_DIMENSION,
+        collection_name=COLLECTION_NAME,
+        connection_string=connection_string(),
+        embedding_function=get_embeddings(),
+    )
+
+
+def _scalar(store: IRISVector, sql: str):
+    """
+    Runs a read on the store's connection in a transaction of its own. A bare execute
+    would autobegin one that nothing ends, and IRISVector's own `with _conn.begin():`
+    writes then fail on that connection.
+    """
+    with store._conn.begin():
+        return store._conn.execute(sqlalchemy.text(sql)).scalar()
+
+
+def _is_healthy(store: IRISVector) -> bool:
+    try:
+        _scalar(store, 'SELECT 1')
+        return True
+    except Exception:
+        return False
+
+
+def _close(store: IRISVector) -> None:
+    try:
+        store._conn.close()
+    except Exception:
+        pass
+
+
+class VectorStorePool:
+    """
+    Thread-safe pool of IRISVector instances. Each instance owns one IRIS connection,
+    which is created lazily, health-checked after sitting idle, and replaced when it
+    breaks, so callers only pay for their queries.
+    """
+
+    def __init__(self, size: int):
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: queue.LifoQueue[tuple[IRISVector, float, int]] = queue.LifoQueue()
+        # Bumped by discard_all(); stores from an older generation are closed instead of reused.
+        self._generation = 0
+
+    def _checkout(self) -> tuple[IRISVector, int]:
+        while True:
+            generation = self._generation
+            try:
+                store, last_used, store_generation = self._idle.get_nowait()
+            except queue.Empty:
+                return _create_store(), generation
+            if store_generation == generation and (time.monotonic() - last_used < HEALTHCHECK_INTERVAL or _is_healthy(store)):
+                return store, store_generation
+            print("Dropping stale IRIS connection")
+            _close(store)
+
+    def discard_all(self) -> None:
+        """Retires every pooled store, e.g. after the collection's table was dropped and recreated."""
+        self._generation += 1
+
+    @contextmanager
+    def connection(self) -> Iterator[IRISVector]:
+        with self._slots:
+            store, generation = self._checkout()
+            broken = False
+            try:
+                yield store
+            except (sqlalchemy.exc.DBAPIError, sqlalchemy.exc.InvalidRequestError):
+                # The connection may be broken, or stuck in a transaction; don't hand it to the next caller.
+                broken = True
+                raise
+            finally:
+                if broken or generation != self._generation:
+                    _close(store)
+                else:
+                    self._idle.put((store, time.monotonic(), generation))
+
+
+_pool = VectorStorePool(int(os.getenv('IRIS_POOL_SIZE', 4)))
+_local_store: LocalVectorStore | None = None
+
+
+def _get_local_store() -> LocalVectorStore:
+    global _local_store
+    embeddings = get_embeddings()
+    with _lock:
+        if _local_store is None:
+            _local_store = LocalVectorStore(os.path.join(LOCAL_VECTOR_DIR, COLLECTION_NAME), EMBEDDING_DIMENSION, embeddings)
+        return _local_store
+
+
+def vector_store() -> AbstractContextManager[IRISVector | LocalVectorStore]:
+    """Checks a vector store out for the duration of a `with` block, from the backend chosen by VECTOR_BACKEND."""
+    if VECTOR_BACKEND == 'local':
+        # The local store is thread-safe, so every caller shares one instance.
+        return nullcontext(_get_local_store())
+    return _pool.connection()
+
+
+def count_vectors() -> int:
+    """Rows in the collection, counted by the backend rather than by fetching ids."""
+    with vector_store() as db:
+        if isinstance(db, LocalVectorStore):
+            return db.count()
+        return _scalar(db, f'SELECT COUNT(*) FROM {COLLECTION_NAME}')
+
+
+def drop_collection() -> None:
+    """Deletes every row in one operation. Pooled IRIS stores recreate the table when next created."""
+    with vector_store() as db:
+        db.delete_collection()
+    if VECTOR_BACKEND != 'local':
+        _pool.discard_all()
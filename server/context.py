@@ -0,0 +1,221 @@
+import os
+from dataclasses import dataclass
+
+import tiktoken
+from langchain.docstore.document import Document
+from page_index import chunk_id, page_index
+from process_video import VideoSummary, VideoSummarySegment
+from retrieval import tokenize
+from summaries import summary_store
+
+# Token budget for the instructions handed to the codegen agent.
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 12000))
+# Share of the budget the video segments may take before docs are packed.
+SEGMENT_BUDGET_SHARE = float(os.getenv('CONTEXT_SEGMENT_SHARE', 0.35))
+# MMR trade-off between relevance (1.0) and diversity (0.0).
+MMR_LAMBDA = float(os.getenv('CONTEXT_MMR_LAMBDA', 0.7))
+# Chunks at least this similar to one already selected are dropped as duplicates.
+DUPLICATE_SIMILARITY = 0.9
+# Shortest suffix/prefix overlap worth merging two chunks over.
+MIN_OVERLAP_CHARS = 40
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding('cl100k_base')
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _similarity(a: set[str], b: set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class _Segment:
+    start: float
+    end: float
+    speech: list[str]
+    screen_events: list[str]
+    active_files: list[str]
+    visited_urls: list[str]
+
+
+def collapse_segments(segments: list[VideoSummarySegment]) -> list[_Segment]:
+    """
+    Merges runs of consecutive segments that show the same thing: no new speech,
+    the same files and URLs, and near-identical screen events. Gemini emits a
+    segment every few seconds, so a user reading one page becomes a single entry.
+    """
+    collapsed: list[_Segment] = []
+    previous_events: set[str] = set()
+    for segment in segments:
+        events = {token for event in segment.screen_events for token in tokenize(event)}
+        last = collapsed[-1] if collapsed else None
+        speech = segment.user_speech.strip()
+        if (
+            last is not None
+            and (not speech or speech in last.speech)
+            and set(segment.active_files) <= set(last.active_files)
+            and set(segment.visited_urls) <= set(last.visited_urls)
+            and _similarity(events, previous_events) >= 0.6
+        ):
+            last.end = segment.end_timestamp
+            last.screen_events.extend(e for e in segment.screen_events if e not in last.screen_events)
+        else:
+            collapsed.append(_Segment(
+                segment.start_timestamp, segment.end_timestamp, [speech] if speech else [],
+                list(segment.screen_events), list(segment.active_files), list(segment.visited_urls),
+            ))
+        previous_events = events
+    return collapsed
+
+
+def format_segment(segment: _Segment) -> str:
+    return f"""\
+[{segment.start:.0f}s-{segment.end:.0f}s] {' '.join(segment.speech)}
+
+Screen Events: {segment.screen_events}
+Visited Files: {segment.active_files}
+Visited URLs: {segment.visited_urls}
+"""
+
+
+def select_docs(docs: list[Document], budget: int, header_tokens: dict[str, int] | None = None) -> list[Document]:
+    """
+    Picks chunks by maximal marginal relevance until `budget` tokens are used.
+    Relevance is the retrieval rank; redundancy is word-set Jaccard similarity to
+    the chunks already picked, and near-duplicates are dropped outright. The first
+    chunk picked from a page also pays for that page's header (`header_tokens`).
+    """
+    header_tokens = header_tokens or {}
+    candidates = [(i, doc, set(tokenize(doc.page_content)), count_tokens(doc.page_content)) for i, doc in enumerate(docs)]
+    selected: list[tuple[int, Document, set[str], int]] = []
+    selected_sources: set[str] = set()
+    used = 0
+    while candidates:
+        best, best_score, best_cost = None, float('-inf'), 0
+        for candidate in candidates:
+            rank, doc, terms, tokens = candidate
+            source = doc.metadata['source']
+            cost = tokens + (header_tokens.get(source, 0) if source not in selected_sources else 0)
+            if used + cost > budget:
+                continue
+            redundancy = max((_similarity(terms, s[2]) for s in selected), default=0.0)
+            if redundancy >= DUPLICATE_SIMILARITY:
+                continue
+            score = MMR_LAMBDA * (1 - rank / len(docs)) - (1 - MMR_LAMBDA) * redundancy
+            if score > best_score:
+                best, best_score, best_cost = candidate, score, cost
+        if best is None:
+            break
+        selected.append(best)
+        selected_sources.add(best[1].metadata['source'])
+        used += best_cost
+        candidates.remove(best)
+    return [doc for _, doc, _, _ in sorted(selected, key=lambda s: s[0])]
+
+
+def _merge(a: str, b: str) -> str:
+    """Joins two chunks of one page, dropping text `b` repeats from the end of `a`."""
+    if b in a:
+        return a
+    for size in range(min(len(a), len(b)), MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:size]):
+            return a + b[size:]
+    return f"{a}\n\n{b}"
+
+
+def page_summaries(docs: list[Document]) -> dict[str, str]:
+    """
+    The summary of every page the chunks come from. Vector hits carry it in their
+    metadata; pages only BM25 surfaced are looked up in the summary store.
+    """
+    summaries = {}
+    for doc in docs:
+        if doc.metadata.get('summary'):
+            summaries.setdefault(doc.metadata['source'], doc.metadata['summary'])
+    missing = list(dict.fromkeys(doc.metadata['source'] for doc in docs if doc.metadata['source'] not in summaries))
+    summaries.update({source: summary for source, (_, summary) in summary_store.lookup(missing).items()})
+    return summaries
+
+
+def group_by_source(docs: list[Document], summaries: dict[str, str]) -> list[tuple[str, str, str]]:
+    """
+    Returns (source, summary, text) per page, in order of each page's best chunk.
+    A page's chunks are put back in page order and overlapping ones merged.
+    """
+    by_source: dict[str, list[Document]] = {}
+    for doc in docs:
+        by_source.setdefault(doc.metadata['source'], []).append(doc)
+
+    pages = []
+    for source, chunks in by_source.items():
+        record = page_index.get(source)
+        position = {doc_id: i for i, doc_id in enumerate(record.chunk_ids)} if record else {}
+        chunks = sorted(chunks, key=lambda d: position.get(chunk_id(source, d.page_content), len(position)))
+        text = chunks[0].page_content
+        for chunk in chunks[1:]:
+            text = _merge(text, chunk.page_content)
+        pages.append((source, summaries.get(source, ''), text))
+    return pages
+
+
+def format_page(source: str, summary: str, text: str) -> str:
+    summary = f"Page Summary: {summary}\n\n" if summary else ''
+    return f"""\
+URL: {source}
+{summary}{text}
+"""
+
+
+def assemble_instructions(summary: VideoSummary, docs: list[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Builds the agent's instructions within `budget` tokens: the intention and
+    summary, then the collapsed video segments (up to their share of the budget),
+    then as many diverse, deduplicated doc chunks as fit, grouped by page.
+    """
+    header = f"""\
+Intention: {summary.user_intention}
+
+Summary: {summary.overall_summary}
+"""
+    remaining = budget - count_tokens(header)
+
+    segments = collapse_segments(summary.segments)
+    segment_budget = int(remaining * SEGMENT_BUDGET_SHARE)
+    formatted_segments = []
+    for segment in segments:
+        formatted = format_segment(segment)
+        tokens = count_tokens(formatted)
+        if tokens > segment_budget:
+            break
+        formatted_segments.append(formatted)
+        segment_budget -= tokens
+        remaining -= tokens
+    if len(formatted_segments) < len(segments):
+        formatted_segments.append(f"({len(segments) - len(formatted_segments)} later segments omitted)\n")
+
+    summaries = page_summaries(docs)
+    # A page's header (and the blank line joining it to the previous page) counts against the budget once.
+    header_tokens = {
+        source: count_tokens(format_page(source, summaries.get(source, ''), '')) + 1
+        for source in {doc.metadata['source'] for doc in docs}
+    }
+    pages = group_by_source(select_docs(docs, max(remaining, 0), header_tokens), summaries)
+    print(f"Context: {len(segments)}/{len(summary.segments)} segments, {len(pages)} pages from {len(docs)} chunks")
+
+    segments_text = '\n'.join(formatted_segments)
+    docs_text = '\n'.join(format_page(*page) for page in pages)
+    return f"""\
+{header}
+Segments:
+{segments_text}
+
+Docs:
+{docs_text}
+"""
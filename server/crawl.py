@@ -0,0 +1,296 @@
+"""
+Bulk ingestion: crawls documentation sites ahead of time so /respond finds
+their pages already chunked, summarized and embedded.
+
+    python crawl.py --seed https://docs.anthropic.com/en/api/ --max-pages 500
+    python crawl.py --sitemap https://platform.openai.com/sitemap.xml --path-prefix /docs
+    python crawl.py --checkpoint .crawl_state.json    # resume an interrupted crawl
+
+Pages are fetched through the scrape cache (so ingestion reuses the render),
+links are followed within the allowed domains and path prefixes, and fetched
+pages are handed to an Ingestor in batches. Progress is checkpointed to a JSON
+file after every batch; rerunning with the same checkpoint resumes the crawl.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from urllib.parse import urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+
+import requests
+from bs4 import BeautifulSoup
+from ingest import Ingestor
+from scrape import get_html
+from scrape_cache import normalize_url, scrape_cache
+
+USER_AGENT = 'CodeFusionCrawler'
+_SKIPPED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico', '.pdf', '.zip', '.gz', '.mp4', '.css', '.js', '.xml', '.json')
+
+
+@dataclass
+class CrawlState:
+    """Everything needed to resume a crawl; serialized as the checkpoint."""
+    frontier: list[tuple[str, int]] = field(default_factory=list)  # (url, depth), including pages in flight
+    seen: set[str] = field(default_factory=set)                    # every URL ever queued
+    fetched: list[str] = field(default_factory=list)
+    ingested: set[str] = field(default_factory=set)
+    failed: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: str) -> 'CrawlState | None':
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        return cls(
+            frontier=[tuple(item) for item in data['frontier']], seen=set(data['seen']), fetched=data['fetched'],
+            ingested=set(data['ingested']), failed=data['failed'],
+        )
+
+    def save(self, path: str) -> None:
+        data = {
+            'frontier': self.frontier, 'seen': sorted(self.seen), 'fetched': self.fetched,
+            'ingested': sorted(self.ingested), 'failed': self.failed,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+@dataclass
+class Scope:
+    domains: set[str]
+    path_prefixes: list[str]
+
+    def allows(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or (parts.hostname or '').lower() not in self.domains:
+            return False
+        if parts.path.lower().endswith(_SKIPPED_EXTENSIONS):
+            return False
+        path = parts.path.rstrip('/') + '/'
+        return any(path.startswith(prefix) for prefix in self.path_prefixes)
+
+
+def read_sitemap(url: str, limit: int) -> list[str]:
+    """Page URLs listed by a sitemap, following sitemap indexes."""
+    response = requests.get(url, timeout=30, headers={'User-Agent': USER_AGENT})
+    response.raise_for_status()
+    root = ElementTree.fromstring(response.content)
+    locations = [element.text.strip() for element in root.iter() if element.tag.endswith('loc') and element.text]
+    if not root.tag.endswith('sitemapindex'):
+        return locations[:limit]
+    urls = []
+    for sitemap in locations:
+        if len(urls) >= limit:
+            break
+        urls.extend(read_sitemap(sitemap, limit - len(urls)))
+    return urls
+
+
+def extract_links(base_url: str, html: str) -> list[str]:
+    soup = BeautifulSoup(html, 'html.parser')
+    return [urljoin(base_url, anchor['href']) for anchor in soup.find_all('a', href=True)]
+
+
+class Politeness:
+    """Spaces out requests to each host by `delay` seconds and honours robots.txt."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._next_slot: dict[str, float] = {}
+        self._robots: dict[str, RobotFileParser | None] = {}
+        # One robots.txt fetch per host at a time; other hosts' workers never wait on it.
+        self._robots_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fetch_robots(host: str) -> RobotFileParser | None:
+        try:
+            response = requests.get(f"{host}/robots.txt", timeout=10, headers={'User-Agent': USER_AGENT})
+        except requests.RequestException:
+            return None
+        if not response.ok:
+            return None
+        parser = RobotFileParser()
+        parser.parse(response.text.splitlines())
+        return parser
+
+    def _robots_for(self, host: str) -> RobotFileParser | None:
+        with self._lock:
+            if host in self._robots:
+                return self._robots[host]
+            host_lock = self._robots_locks.setdefault(host, threading.Lock())
+        with host_lock:
+            with self._lock:
+                if host in self._robots:
+                    return self._robots[host]  # fetched by another worker meanwhile
+            robots = self._fetch_robots(host)
+            with self._lock:
+                self._robots[host] = robots
+            return robots
+
+    def allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        robots = self._robots_for(f"{parts.scheme}://{parts.netloc}")
+        return robots is None or robots.can_fetch(USER_AGENT, url)
+
+    def wait_turn(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.delay
+        time.sleep(slot - now)
+
+
+class Crawler:
+    def __init__(
+        self,
+        state: CrawlState,
+        scope: Scope,
+        checkpoint_path: str,
+        max_pages: int = 200,
+        max_depth: int = 3,
+        concurrency: int = 8,
+        delay: float = 1.0,
+        batch_size: int = 20,
+    ):
+        self.state = state
+        self.scope = scope
+        self.checkpoint_path = checkpoint_path
+        self.max_pages, self.max_depth = max_pages, max_depth
+        self.concurrency, self.batch_size = concurrency, batch_size
+        self.politeness = Politeness(delay)
+        self.frontier = deque(state.frontier)
+        self._lock = threading.Lock()
+        self._ingestor = Ingestor(on_result=self._on_ingested)
+
+    def _on_ingested(self, url: str, outcome: str) -> None:
+        with self._lock:
+            if outcome == 'ok':
+                self.state.ingested.add(url)
+                self.state.failed.pop(url, None)
+            else:
+                self.state.failed[url] = outcome
+
+    def checkpoint(self, in_flight: list[tuple[str, int]] = ()) -> None:
+        # Pages still being fetched are saved as queued, so a resumed crawl fetches them again.
+        with self._lock:
+            self.state.frontier = list(in_flight) + list(self.frontier)
+            self.state.save(self.checkpoint_path)
+
+    def fetch(self, url: str) -> list[str]:
+        """Fetches a page into the scrape cache and returns the links on it."""
+        if not self.politeness.allowed(url):
+            raise PermissionError("disallowed by robots.txt")
+        cached = scrape_cache.get(url)
+        if not (cached and cached.fresh):
+            self.politeness.wait_turn(url)
+        return extract_links(url, get_html(url))
+
+    def enqueue(self, url: str, depth: int) -> None:
+        url = normalize_url(url)
+        if url not in self.state.seen and self.scope.allows(url):
+            self.state.seen.add(url)
+            self.frontier.append((url, depth))
+
+    def run(self) -> CrawlState:
+        # Pages fetched before an interruption but not yet ingested go straight to ingestion.
+        pending_ingest = [url for url in self.state.fetched if url not in self.state.ingested]
+        in_flight: dict = {}
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='crawl') as pool:
+            while self.frontier or in_flight:
+                while self.frontier and len(in_flight) < self.concurrency and len(self.state.fetched) + len(in_flight) < self.max_pages:
+                    url, depth = self.frontier.popleft()
+                    in_flight[pool.submit(self.fetch, url)] = (url, depth)
+                if not in_flight:
+                    break  # page budget reached
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = in_flight.pop(future)
+                    try:
+                        links = future.result()
+                    except Exception as e:
+                        print(f"Failed to fetch {url}: {e}")
+                        with self._lock:
+                            self.state.failed[url] = str(e)
+                        continue
+                    self.state.fetched.append(url)
+                    pending_ingest.append(url)
+                    if depth < self.max_depth:
+                        for link in links:
+                            self.enqueue(link, depth + 1)
+
+                if len(pending_ingest) >= self.batch_size:
+                    self._ingestor.submit(pending_ingest)
+                    pending_ingest = []
+                    self.checkpoint(list(in_flight.values()))
+                    print(f"Fetched {len(self.state.fetched)} pages, {len(self.frontier)} queued, "
+                          f"{len(self.state.ingested)} ingested ({time.monotonic() - started:.0f}s)")
+
+        self._ingestor.submit(pending_ingest)
+        self._ingestor.wait(timeout=None)
+        self.checkpoint()
+        return self.state
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crawl documentation sites into the knowledge base")
+    parser.add_argument('--seed', action='append', default=[], help="Start URL (repeatable)")
+    parser.add_argument('--seed-file', help="File with one start URL per line")
+    parser.add_argument('--sitemap', action='append', default=[], help="Sitemap or sitemap index URL (repeatable)")
+    parser.add_argument('--domain', action='append', default=[], help="Allowed host (default: the seeds' hosts)")
+    parser.add_argument('--path-prefix', action='append', default=[], help="Allowed path prefix (default: the seeds' directories)")
+    parser.add_argument('--max-pages', type=int, default=200)
+    parser.add_argument('--max-depth', type=int, default=3, help="Link hops from a seed")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=1.0, help="Seconds between requests to the same host")
+    parser.add_argument('--batch-size', type=int, default=20, help="Pages handed to ingestion at a time")
+    parser.add_argument('--checkpoint', default='.crawl_state.json')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    state = CrawlState.load(args.checkpoint)
+    seeds = list(args.seed)
+    if args.seed_file:
+        with open(args.seed_file) as f:
+            seeds.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    for sitemap in args.sitemap:
+        seeds.extend(read_sitemap(sitemap, args.max_pages))
+    if state is None and not seeds:
+        raise SystemExit("Nothing to crawl: give --seed, --seed-file or --sitemap, or an existing --checkpoint")
+
+    start_urls = seeds or [url for url, _ in state.frontier] or state.fetched
+    domains = set(args.domain) or {urlsplit(url).hostname.lower() for url in start_urls}
+    prefixes = args.path_prefix or sorted({urlsplit(url).path.rsplit('/', 1)[0] + '/' for url in start_urls})
+    if state is None:
+        state = CrawlState()
+    else:
+        print(f"Resuming: {len(state.fetched)} fetched, {len(state.frontier)} queued, {len(state.ingested)} ingested")
+
+    crawler = Crawler(
+        state, Scope(domains, prefixes), args.checkpoint, max_pages=args.max_pages, max_depth=args.max_depth,
+        concurrency=args.concurrency, delay=args.delay, batch_size=args.batch_size,
+    )
+    for seed in seeds:
+        crawler.enqueue(seed, 0)
+    state = crawler.run()
+    print(f"Done: {len(state.fetched)} fetched, {len(state.ingested)} ingested, {len(state.failed)} failed, "
+          f"{len(state.frontier)} left in the frontier")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import openai
+import tiktoken
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from tracing import add_usage, span
+
+load_dotenv()
+
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-ada-002')
+BATCH_MAX_TOKENS = int(os.getenv('EMBED_BATCH_MAX_TOKENS', 100_000))
+BATCH_MAX_INPUTS = int(os.getenv('EMBED_BATCH_MAX_INPUTS', 2048))
+# How long the scheduler waits for more texts before sending a partial batch.
+BATCH_LINGER = float(os.getenv('EMBED_BATCH_LINGER_MS', 25)) / 1000
+CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', 4))
+# Account limits; the scheduler also tightens these from the x-ratelimit-* response headers.
+TOKENS_PER_MINUTE = int(os.getenv('EMBED_TOKENS_PER_MINUTE', 1_000_000))
+REQUESTS_PER_MINUTE = int(os.getenv('EMBED_REQUESTS_PER_MINUTE', 3000))
+MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', 6))
+# The model's per-input limit; longer texts are truncated rather than failing the shared batch.
+MAX_INPUT_TOKENS = int(os.getenv('EMBED_MAX_INPUT_TOKENS', 8191))
+# Upper bound on how long a caller waits for its vectors, retries and rate limit waits included.
+EMBED_TIMEOUT = float(os.getenv('EMBED_TIMEOUT', 600))
+
+
+class RateLimiter:
+    """Token buckets for the provider's tokens-per-minute and requests-per-minute limits."""
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int):
+        self.tpm, self.rpm = tokens_per_minute, requests_per_minute
+        self.tokens, self.requests = float(tokens_per_minute), float(requests_per_minute)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.updated = now
+
+    def acquire(self, tokens: int) -> None:
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= tokens and self.requests >= 1:
+                    self.tokens -= tokens
+                    self.requests -= 1
+                    return
+                wait = max(
+                    self.paused_until - now,
+                    (tokens - self.tokens) * 60 / self.tpm,
+                    (1 - self.requests) * 60 / self.rpm,
+                )
+            time.sleep(max(wait, 0.01))
+
+    def observe(self, remaining_tokens: int | None, remaining_requests: int | None) -> None:
+        with self._lock:
+            if remaining_tokens is not None:
+                self.tokens = min(self.tokens, remaining_tokens)
+            if remaining_requests is not None:
+                self.requests = min(self.requests, remaining_requests)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+@dataclass
+class _Request:
+    texts: list[str]
+    future: Future = field(default_factory=Future)
+    vectors: list = field(default_factory=list)
+    remaining: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self.vectors = [None] * len(self.texts)
+        self.remaining = len(self.texts)
+
+    def fill(self, index: int, vector: list[float]) -> None:
+        with self.lock:
+            self.vectors[index] = vector
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.future.set_result(self.vectors)
+
+    def fail(self, error: BaseException) -> None:
+        with self.lock:
+            if not self.future.done():
+                self.future.set_exception(error)
+
+
+def _header_int(headers, name: str) -> int | None:
+    value = headers.get(name)
+    return int(value) if value and value.isdigit() else None
+
+
+def _retry_after(error: openai.APIStatusError) -> float | None:
+    value = error.response.headers.get('retry-after') if error.response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class EmbeddingScheduler:
+    """
+    Collects texts from every caller in the process into token-bounded batches,
+    sends them under the provider's rate limits with jittered exponential backoff on
+    429s and server errors, and hands each caller back its own vectors.
+    """
+
+    def __init__(self, client: openai.Client, model: str = EMBEDDING_MODEL, encoding: tiktoken.Encoding | None = None):
+        self.client = client
+        self.model = model
+        self.limiter = RateLimiter(TOKENS_PER_MINUTE, REQUESTS_PER_MINUTE)
+        self._encoding = encoding or tiktoken.get_encoding('cl100k_base')
+        self._queue: queue.Queue[tuple[_Request, int, int]] = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix='embed')
+        threading.Thread(target=self._collect, name='embed-scheduler', daemon=True).start()
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        texts, counts = zip(*(self._truncate(text) for text in texts))
+        request = _Request(list(texts))
+        add_usage('embedding_tokens', sum(counts))
+        with span('embed'):
+            for i, count in enumerate(counts):
+                self._queue.put((request, i, count))
+            return request.future.result(timeout=EMBED_TIMEOUT)
+
+    def _truncate(self, text: str) -> tuple[str, int]:
+        """The text cut to the model's input limit, and its token count."""
+        tokens = self._encoding.encode(text, disallowed_special=())
+        if len(tokens) <= MAX_INPUT_TOKENS:
+            return text, len(tokens)
+        print(f"Truncating a {len(tokens)}-token embedding input to {MAX_INPUT_TOKENS} tokens")
+        return self._encoding.decode(tokens[:MAX_INPUT_TOKENS]), MAX_INPUT_TOKENS
+
+    def _collect(self) -> None:
+        pending = None
+        while True:
+            batch = [pending] if pending else [self._queue.get()]
+            pending = None
+            tokens = batch[0][2]
+            deadline = time.monotonic() + BATCH_LINGER
+            while len(batch) < BATCH_MAX_INPUTS:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if tokens + item[2] > BATCH_MAX_TOKENS:
+                    pending = item
+                    break
+                batch.append(item)
+                tokens += item[2]
+            self._senders.submit(self._dispatch, batch, tokens)
+
+    def _dispatch(self, batch: list[tuple[_Request, int, int]], tokens: int) -> None:
+        """Sends a batch and makes sure every input in it ends up with a vector or an error."""
+        try:
+            self._send(batch, tokens)
+            error = RuntimeError("the embeddings response had no vector for this input")
+        except BaseException as e:
+            error = e
+        for request, i, _ in batch:
+            if request.vectors[i] is None:
+                request.fail(error)
+
+    def _send(self, batch: list[tuple[_Request, int, int]], tokens: int) -> None:
+        inputs = [request.texts[i] for request, i, _ in batch]
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire(tokens)
+            try:
+                with span('embed_request'):
+                    raw = self.client.embeddings.with_raw_response.create(model=self.model, input=inputs)
+                break
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = min(2 ** attempt, 60) * random.uniform(0.5, 1.5)
+                if isinstance(e, openai.APIStatusError):
+                    delay = max(delay, _retry_after(e) or 0)
+                if isinstance(e, openai.RateLimitError):
+                    self.limiter.pause(delay)
+                print(f"Embedding batch of {len(inputs)} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+        self.limiter.observe(
+            _header_int(raw.headers, 'x-ratelimit-remaining-tokens'),
+            _header_int(raw.headers, 'x-ratelimit-remaining-requests'),
+        )
+        response = raw.parse()
+        for (request, i, _), item in zip(batch, sorted(response.data, key=lambda d: d.index)):
+            request.fill(i, item.embedding)
+
+
+class ScheduledEmbeddings(Embeddings):
+    """LangChain embeddings that route through a shared EmbeddingScheduler."""
+
+    def __init__(self, scheduler: EmbeddingScheduler):
+        self.scheduler = scheduler
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.scheduler.embed(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.scheduler.embed([text])[0]
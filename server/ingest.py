@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable
+
+from page_index import content_hash, page_index
+from scrape import get_markdown, is_page_current, store_markdown
+from scrape_cache import normalize_url
+from summaries import summarize_page, summary_store
+from tracing import in_context
+
+
+# Per-provider concurrency limits, shared by every request in the process.
+# ScrapingBee renders are limited by SCRAPE_CONCURRENCY in scrape.py, so cache
+# hits never queue behind slow renders; embedding requests are batched and
+# rate-limited by embedding_scheduler.py, and vector store writes by the pool
+# in clients.py.
+# gpt-4o page summaries; the pool size is the concurrency limit.
+_summary_pool = ThreadPoolExecutor(max_workers=int(os.getenv('SUMMARY_CONCURRENCY', 4)), thread_name_prefix='summary')
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 16))  # URLs in flight per request
+INGEST_TIMEOUT = float(os.getenv('INGEST_TIMEOUT', 90))
+
+
+def ingest_url(url: str, cached_summary: tuple[str, str] | None = None) -> None:
+    # Pages are stored under their normalized URL, the key the crawler and retrieval use too.
+    url = normalize_url(url)
+    # The summary only depends on the URL, so for pages we have never seen it is
+    # generated while the page is being scraped instead of after. Indexed pages may
+    # turn out current, so their summary waits for the check below.
+    pending: Future | None = None
+    if cached_summary is None and page_index.get(url) is None:
+        pending = _summary_pool.submit(in_context(summarize_page), url)
+
+    markdown = get_markdown(url)
+    if is_page_current(url, markdown):
+        return
+    version = content_hash(markdown)
+    if cached_summary and cached_summary[0] == version:
+        summary = cached_summary[1]
+    else:
+        summary = (pending or _summary_pool.submit(in_context(summarize_page), url)).result()
+        summary_store.put(url, version, summary)
+    store_markdown(url, markdown, summary)
+
+
+def _outcome(future: Future) -> str:
+    if future.cancelled():
+        return 'timeout'
+    return 'ok' if future.exception() is None else str(future.exception())
+
+
+class Ingestor:
+    """
+    Ingests URLs as they are discovered. Each submitted URL starts scraping,
+    summarizing and embedding immediately; `wait()` then collects the outcomes.
+    """
+
+    def __init__(self, on_result: Callable[[str, str], None] | None = None):
+        self.on_result = on_result
+        self._executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+        self._futures: dict[Future, str] = {}
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+
+    def submit(self, urls: list[str]) -> None:
+        with self._lock:
+            seen = set(self._futures.values())
+            urls = [url for url in dict.fromkeys(map(normalize_url, urls)) if url not in seen]
+            if not urls:
+                return
+            known_summaries = summary_store.lookup(urls)
+            for url in urls:
+                future = self._executor.submit(in_context(ingest_url), url, known_summaries.get(url))
+                if self.on_result:
+                    future.add_done_callback(lambda f, url=url: self.on_result(url, _outcome(f)))
+                self._futures[future] = url
+
+    def wait(self, timeout: float = INGEST_TIMEOUT) -> dict[str, str]:
+        """
+        Waits up to `timeout` seconds for every submitted URL and returns the outcome
+        per URL ('ok', 'timeout' or the error message). URLs that fail or are still
+        running are reported and left behind, so they never fail the caller.
+        """
+        with self._lock:
+            futures = dict(self._futures)
+        done, _ = wait(futures, timeout=timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+        results = {}
+        for future, url in futures.items():
+            results[url] = _outcome(future) if future in done else 'timeout'
+            if results[url] != 'ok':
+                print(f"Failed to ingest {url}: {results[url]}")
+        print(f"Ingested {len(futures)} URLs in {time.monotonic() - self._start:.1f}s")
+        return results
+
+
+def ingest_urls(
+    urls: set[str],
+    timeout: float = INGEST_TIMEOUT,
+    on_result: Callable[[str, str], None] | None = None,
+) -> dict[str, str]:
+    """Scrape, summarize and embed every URL concurrently; see `Ingestor.wait` for the result."""
+    if not urls:
+        return {}
+    ingestor = Ingestor(on_result)
+    ingestor.submit(list(urls))
+    return ingestor.wait(timeout)
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+from tracing import trace
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_TTL = float(os.getenv('JOB_TTL', 60 * 60))  # finished jobs are forgotten after this many seconds
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = 'queued'  # queued | running | done | failed
+    events: list[dict] = field(default_factory=list)
+    result: Any = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    changed: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def emit(self, stage: str, data: Any = None) -> None:
+        """Records a stage result and wakes anyone streaming this job's events."""
+        with self.changed:
+            self.events.append({'stage': stage, 'data': data, 'at': time.time()})
+            self.changed.notify_all()
+
+    def _finish(self, status: str, result: Any = None, error: str | None = None) -> None:
+        with self.changed:
+            self.status, self.result, self.error = status, result, error
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def wait_for_events(self, after: int, timeout: float) -> list[dict]:
+        """Blocks until there are events past index `after`, the job finishes, or `timeout` elapses."""
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.events) > after or self.finished, timeout=timeout)
+            return self.events[after:]
+
+    def to_dict(self) -> dict:
+        with self.changed:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'events': list(self.events),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+            }
+
+
+class JobRunner:
+    """Runs pipeline functions on a background worker pool and keeps their progress for polling."""
+
+    def __init__(self, workers: int, ttl: float):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args, on_finish: Callable[[], None] | None = None) -> Job:
+        """Runs `fn(*args, emit=job.emit)` in the background; its return value becomes the job result."""
+        job = Job(id=uuid.uuid4().hex)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, on_finish)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, on_finish: Callable[[], None] | None) -> None:
+        with job.changed:
+            job.status = 'running'
+        try:
+            with trace('job', job.id):
+                result = fn(*args, emit=job.emit)
+            job._finish('done', result=result)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job._finish('failed', error=str(e))
+        finally:
+            if on_finish:
+                on_finish()
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+job_runner = JobRunner(JOB_WORKERS, JOB_TTL)
@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import uuid
+from typing import Any
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+
+
+class LocalVectorStore:
+    """
+    In-process vector store with the subset of the IRISVector API this server uses.
+
+    Rows live in two append-only files: `vectors-N.f32` (normalized float32 rows,
+    memory-mapped for search) and `meta-N.jsonl` (one record per row, plus tombstones
+    for deletes). A row only exists once both its vector and its metadata line are
+    written, so a crash mid-append is undone on the next load by truncating both files
+    back to the last complete record. Compaction writes generation N+1 and switches
+    to it by atomically replacing the `CURRENT` file. Search is exact brute-force
+    cosine over the live rows.
+    """
+
+    def __init__(self, root: str, dimension: int, embedding_function: Embeddings):
+        self.root = root
+        self.dimension = dimension
+        self.embedding_function = embedding_function
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _paths(self, generation: int) -> tuple[str, str]:
+        return (os.path.join(self.root, f'vectors-{generation}.f32'), os.path.join(self.root, f'meta-{generation}.jsonl'))
+
+    def _load(self) -> None:
+        try:
+            with open(os.path.join(self.root, 'CURRENT')) as f:
+                self._generation = int(f.read())
+        except FileNotFoundError:
+            self._generation = 0
+        self._vectors_path, self._meta_path = self._paths(self._generation)
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._alive: list[bool] = []
+        self._rows: dict[str, int] = {}
+        # Rows per `source` metadata value (including dead ones), so source filters skip the per-row scan.
+        self._rows_by_source: dict[Any, list[int]] = {}
+        row_bytes = self.dimension * 4
+        with open(self._vectors_path, 'ab') as f:
+            stored_rows = f.tell() // row_bytes
+        committed = 0
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # torn write from a crash
+                    record = json.loads(line)
+                    if 'delete' not in record and len(self._ids) == stored_rows:
+                        break  # metadata without its vector
+                    self._apply(record)
+                    committed += len(line)
+            with open(self._meta_path, 'r+b') as f:
+                f.truncate(committed)
+        with open(self._vectors_path, 'r+b') as f:
+            f.truncate(len(self._ids) * row_bytes)
+        self._remap()
+
+    def _apply(self, record: dict) -> None:
+        if 'delete' in record:
+            row = self._rows.pop(record['delete'], None)
+            if row is not None:
+                self._alive[row] = False
+            return
+        if record['id'] in self._rows:
+            self._alive[self._rows[record['id']]] = False
+        self._rows[record['id']] = len(self._ids)
+        self._rows_by_source.setdefault(record['metadata'].get('source'), []).append(len(self._ids))
+        self._ids.append(record['id'])
+        self._texts.append(record['text'])
+        self._metadatas.append(record['metadata'])
+        self._alive.append(True)
+
+    def _remap(self) -> None:
+        if self._ids:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(len(self._ids), self.dimension))
+        else:
+            self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+        self._alive_mask = np.array(self._alive, dtype=bool)
+
+    def _append_meta(self, records: list[dict]) -> None:
+        with open(self._meta_path, 'ab') as f:
+            f.write(b''.join(json.dumps(record).encode('utf-8') + b'\n' for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add_embeddings(
+        self,
+        texts: list[str],
+        embeddings: list[list[float]],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.array(embeddings, dtype=np.float32).reshape(len(texts), self.dimension)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        records = [{'id': i, 'text': t, 'metadata': m} for i, t, m in zip(ids, texts, metadatas)]
+        with self._lock:
+            with open(self._vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._append_meta(records)
+            for record in records:
+                self._apply(record)
+            self._remap()
+        return ids
+
+    def add_texts(self, texts: list[str], metadatas: list[dict] | None = None, ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas, ids)
+
+    def add_documents(self, documents: list[Document], ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        return self.add_texts([d.page_content for d in documents], [d.metadata for d in documents], ids)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> None:
+        with self._lock:
+            ids = [i for i in ids or [] if i in self._rows]
+            if not ids:
+                return
+            self._append_meta([{'delete': i} for i in ids])
+            for i in ids:
+                self._apply({'delete': i})
+            self._alive_mask = np.array(self._alive, dtype=bool)
+            if len(self._rows) < len(self._ids) // 2:
+                self._compact()
+
+    def _compact(self) -> None:
+        live = [row for row, alive in enumerate(self._alive) if alive]
+        vectors = np.array(self._matrix[live]) if live else np.zeros((0, self.dimension), dtype=np.float32)
+        records = [{'id': self._ids[r], 'text': self._texts[r], 'metadata': self._metadatas[r]} for r in live]
+        self._switch_generation(vectors.tobytes(), b''.join(json.dumps(record).encode('utf-8') + b'\n' for record in records))
+
+    def _switch_generation(self, vectors: bytes, meta: bytes) -> None:
+        old_paths = (self._vectors_path, self._meta_path)
+        generation = self._generation + 1
+        current_tmp = os.path.join(self.root, 'CURRENT.tmp')
+        for path, data in zip((*self._paths(generation), current_tmp), (vectors, meta, str(generation).encode())):
+            with open(path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(current_tmp, os.path.join(self.root, 'CURRENT'))
+        self._load()
+        for path in old_paths:
+            os.remove(path)
+
+    def delete_collection(self) -> None:
+        with self._lock:
+            self._switch_generation(b'', b'')
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def get(self, **kwargs: Any) -> dict[str, list]:
+        with self._lock:
+            live = [row for row, alive in enumerate(self._alive) if alive]
+            return {
+                'ids': [self._ids[r] for r in live],
+                'documents': [self._texts[r] for r in live],
+                'metadatas': [self._metadatas[r] for r in live],
+            }
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter: dict | None = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        query = np.array(embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            mask = self._alive_mask.copy()
+            for key, condition in (filter or {}).items():
+                mask &= self._filter_mask(key, condition)
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return []
+            if len(candidates) * 2 < len(mask):
+                similarities = self._matrix[candidates] @ query
+            else:
+                # Scanning the whole mapping beats copying most of it out with fancy indexing.
+                similarities = (self._matrix @ query)[candidates]
+            k = min(k, len(candidates))
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top])]
+            # Scores are cosine distances: lower is closer.
+            return [
+                (Document(page_content=self._texts[candidates[i]], metadata=self._metadatas[candidates[i]]),
+                 float(1 - similarities[i]))
+                for i in top
+            ]
+
+    def _filter_mask(self, key: str, condition: Any) -> np.ndarray:
+        values = condition['$in'] if isinstance(condition, dict) and '$in' in condition else [condition]
+        mask = np.zeros(len(self._ids), dtype=bool)
+        if key == 'source':
+            for value in values:
+                mask[self._rows_by_source.get(value, [])] = True
+            return mask
+        for row in np.flatnonzero(self._alive_mask):
+            mask[row] = self._metadatas[row].get(key) in values
+        return mask
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k, filter)
+
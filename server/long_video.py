@@ -0,0 +1,124 @@
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+import imageio_ffmpeg
+
+FFMPEG = imageio_ffmpeg.get_ffmpeg_exe()
+_MAX_BOXES = 64  # per level; real files have a handful, garbage input shouldn't loop for long
+
+
+@contextmanager
+def local_copy(stream) -> Iterator[str]:
+    """Yields a path to the upload on disk, copying it to a temporary file only if it isn't already one."""
+    name = getattr(stream, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        yield name
+        return
+    with tempfile.NamedTemporaryFile(suffix='.mp4') as copy:
+        stream.seek(0)
+        shutil.copyfileobj(stream, copy, 1024 * 1024)
+        copy.flush()
+        stream.seek(0)
+        yield copy.name
+
+
+def _boxes(stream, start: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    """Yields (type, body start, box end) for the ISO BMFF boxes between `start` and `end`."""
+    offset = start
+    for _ in range(_MAX_BOXES):
+        stream.seek(offset)
+        header = stream.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack('>I4s', header)
+        body = offset + 8
+        if size == 1:
+            size, body = struct.unpack('>Q', stream.read(8))[0], offset + 16
+        elif size == 0:
+            size = end - offset  # the box runs to the end of the file
+        if size < body - offset or offset + size > end:
+            return
+        yield kind, body, offset + size
+        offset += size
+
+
+def stream_duration(stream) -> float | None:
+    """
+    Reads an MP4/MOV upload's duration from its movie header (moov/mvhd), seeking
+    past the media data instead of reading or copying it. Returns None for other
+    containers. The stream position is left unchanged.
+    """
+    position = stream.tell()
+    try:
+        end = stream.seek(0, os.SEEK_END)
+        for kind, body, box_end in _boxes(stream, 0, end):
+            if kind != b'moov':
+                continue
+            for kind, body, _ in _boxes(stream, body, box_end):
+                if kind == b'mvhd':
+                    stream.seek(body)
+                    version = stream.read(1)[0]
+                    # version, flags and the creation/modification times precede the timescale
+                    stream.seek(body + (20 if version == 1 else 12))
+                    timescale, duration = struct.unpack('>IQ' if version == 1 else '>II', stream.read(12 if version == 1 else 8))
+                    return duration / timescale if timescale else None
+            return None
+        return None
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+    finally:
+        stream.seek(position)
+
+
+def probe_duration(path: str) -> float | None:
+    # ffmpeg prints the container duration while failing on the missing output file.
+    result = subprocess.run([FFMPEG, '-hide_banner', '-i', path], capture_output=True, text=True)
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _cut(path: str, start: float, length: float, out_path: str, scale_height: int, fps: float) -> None:
+    filters = []
+    if scale_height:
+        filters.append(f'scale=-2:min({scale_height}\\,ih)')
+    if fps:
+        filters.append(f'fps={fps}')
+    cmd = [FFMPEG, '-hide_banner', '-loglevel', 'error', '-y', '-ss', str(start), '-t', str(length), '-i', path]
+    if filters:
+        cmd += ['-vf', ','.join(filters)]
+    cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-movflags', '+faststart', out_path]
+    subprocess.run(cmd, check=True, capture_output=True)
+
+
+def split_video(
+    path: str,
+    duration: float,
+    window: float,
+    out_dir: str,
+    scale_height: int = 0,
+    fps: float = 0,
+    workers: int = 4,
+) -> list[tuple[float, str]]:
+    """
+    Cuts the recording into consecutive windows of `window` seconds, optionally
+    downscaled to `scale_height` pixels and resampled to `fps`. Returns
+    (start offset, path) for each window.
+    """
+    windows = []
+    start = 0.0
+    while start < duration:
+        windows.append((start, os.path.join(out_dir, f'window_{len(windows):03d}.mp4')))
+        start += window
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda w: _cut(path, w[0], min(window, duration - w[0]), w[1], scale_height, fps), windows))
+    return windows
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict
+from typing import Iterator
+
+from clients import count_vectors, drop_collection, vector_store
+from page_index import page_index
+
+# Vector store rows deleted per call, so no single delete holds a huge id list.
+DELETE_BATCH_SIZE = int(os.getenv('DELETE_BATCH_SIZE', 500))
+
+
+def collection_stats(limit: int | None = 100) -> dict:
+    """
+    Chunk counts, stored bytes and last-ingested time, overall and per page
+    (most recent first, up to `limit`), from aggregate queries on the page index.
+    `untracked_vectors` counts rows the index doesn't know about, e.g. from before it existed.
+    """
+    totals = page_index.totals()
+    vectors = count_vectors()
+    return {
+        **totals,
+        'vectors': vectors,
+        'untracked_vectors': max(vectors - totals['chunks'], 0),
+        'per_source': [asdict(stats) for stats in page_index.stats(limit)],
+    }
+
+
+def prune(
+    sources: list[str] | None = None, older_than: float | None = None, batch_size: int = DELETE_BATCH_SIZE
+) -> Iterator[tuple[int, int]]:
+    """
+    Deletes the chunks of the matching pages (see PageIndex.iter_pages), a batch
+    at a time, and yields running (pages, chunks) totals after each batch. Pages
+    are forgotten only after their rows are gone, so an interrupted prune can be rerun.
+    """
+    pages = chunks = 0
+    for batch in page_index.iter_pages(sources, older_than, batch_size):
+        ids = [chunk_id for page in batch for chunk_id in page.chunk_ids]
+        for start in range(0, len(ids), batch_size):
+            with vector_store() as db:
+                db.delete(ids[start:start + batch_size])
+        page_index.remove([page.source for page in batch])
+        pages += len(batch)
+        chunks += len(ids)
+        yield pages, chunks
+
+
+def flush() -> None:
+    """Empties the vector store and the page index."""
+    drop_collection()
+    page_index.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the documentation vector store")
+    commands = parser.add_subparsers(dest='command', required=True)
+    stats_parser = commands.add_parser('stats', help="Print collection statistics as JSON")
+    stats_parser.add_argument('--limit', type=int, default=100, help="Pages listed individually")
+    prune_parser = commands.add_parser('prune', help="Delete pages by source and/or age")
+    prune_parser.add_argument('--source', action='append', dest='sources', help="Page URL (repeatable)")
+    prune_parser.add_argument('--older-than-days', type=float, help="Pages last ingested more than this many days ago")
+    commands.add_parser('flush', help="Delete everything")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        print(json.dumps(collection_stats(args.limit), indent=2))
+    elif args.command == 'prune':
+        if not args.sources and args.older_than_days is None:
+            parser.error("prune needs --source or --older-than-days (use flush to delete everything)")
+        cutoff = time.time() - args.older_than_days * 86400 if args.older_than_days is not None else None
+        pages = chunks = 0
+        for pages, chunks in prune(args.sources, cutoff):
+            print(f"Pruned {pages} pages ({chunks} chunks) so far")
+        print(f"Pruned {pages} pages, {chunks} chunks")
+    else:
+        flush()
+        print("Flushed the vector store and page index")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+import dotenv
+
+
+@dataclass
+class PageVersion:
+    source: str
+    version: str           # hash of the page markdown that was ingested
+    chunk_ids: list[str]   # ids of the chunks stored for that version
+    ingested_at: float
+
+
+@dataclass
+class SourceStats:
+    source: str
+    chunks: int
+    bytes: int             # UTF-8 size of the stored chunk texts
+    ingested_at: float
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def chunk_id(source: str, chunk: str) -> str:
+    # Deterministic, so re-ingesting an unchanged chunk maps onto the stored row.
+    return content_hash(f"{source}\n{chunk}")[:32]
+
+
+class PageIndex:
+    """
+    Per-URL record of which chunks are in the vector store, used to ingest pages
+    incrementally. Also keeps the chunk texts for lexical search.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_versions (
+                    source TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    chunk_ids TEXT NOT NULL,
+                    ingested_at REAL NOT NULL
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    text TEXT NOT NULL
+                )""")
+            conn.execute('CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)')
+            conn.execute('CREATE INDEX IF NOT EXISTS page_versions_ingested_at ON page_versions (ingested_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, source: str) -> PageVersion | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT source, version, chunk_ids, ingested_at FROM page_versions WHERE source = ?', (source,)
+            ).fetchone()
+        if row is None:
+            return None
+        return PageVersion(row[0], row[1], json.loads(row[2]), row[3])
+
+    def put(self, source: str, version: str, chunks: dict[str, str]) -> None:
+        """Records `chunks` ({id: text}) as the stored content of this version of the page."""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO page_versions VALUES (?, ?, ?, ?)',
+                (source, version, json.dumps(list(chunks)), time.time()),
+            )
+            conn.execute('DELETE FROM chunks WHERE source = ?', (source,))
+            conn.executemany('INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)', [(i, source, t) for i, t in chunks.items()])
+
+    def chunks_for(self, sources: list[str]) -> list[tuple[str, str, str]]:
+        """Returns (id, source, text) for every stored chunk of the given pages."""
+        if not sources:
+            return []
+        placeholders = ', '.join('?' * len(sources))
+        with self._connect() as conn:
+            return conn.execute(f'SELECT id, source, text FROM chunks WHERE source IN ({placeholders})', list(sources)).fetchall()
+
+    def stats(self, limit: int | None = None) -> list[SourceStats]:
+        """Per-page chunk counts and sizes, most recently ingested first, computed in SQLite."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT v.source, COUNT(c.id), COALESCE(SUM(LENGTH(CAST(c.text AS BLOB))), 0), v.ingested_at
+                FROM page_versions v LEFT JOIN chunks c ON c.source = v.source
+                GROUP BY v.source
+                ORDER BY v.ingested_at DESC
+                LIMIT ?""",
+                (-1 if limit is None else limit,),
+            ).fetchall()
+        return [SourceStats(*row) for row in rows]
+
+    def totals(self) -> dict:
+        with self._connect() as conn:
+            sources, oldest, newest = conn.execute(
+                'SELECT COUNT(*), MIN(ingested_at), MAX(ingested_at) FROM page_versions'
+            ).fetchone()
+            chunks, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(text AS BLOB))), 0) FROM chunks').fetchone()
+        return {'sources': sources, 'chunks': chunks, 'bytes': size, 'oldest_ingested_at': oldest, 'last_ingested_at': newest}
+
+    def iter_pages(
+        self, sources: list[str] | None = None, older_than: float | None = None, batch_size: int = 100
+    ) -> Iterator[list[PageVersion]]:
+        """
+        Yields the matching pages in batches, paging by source so the whole index is
+        never loaded at once. `sources` and `older_than` (an ingested_at cutoff)
+        narrow the selection; with neither, every page matches.
+        """
+        conditions, params = ['source > ?'], []
+        if sources is not None:
+            conditions.append(f"source IN ({', '.join('?' * len(sources))})")
+            params.extend(sources)
+        if older_than is not None:
+            conditions.append('ingested_at < ?')
+            params.append(older_than)
+        query = (
+            f"SELECT source, version, chunk_ids, ingested_at FROM page_versions WHERE {' AND '.join(conditions)} "
+            "ORDER BY source LIMIT ?"
+        )
+        after = ''
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(query, [after, *params, batch_size]).fetchall()
+            if not rows:
+                return
+            yield [PageVersion(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+            after = rows[-1][0]
+
+    def remove(self, sources: list[str]) -> None:
+        if not sources:
+            return
+        placeholders = ', '.join('?' * len(sources))
+        with self._connect() as conn:
+            conn.execute(f'DELETE FROM page_versions WHERE source IN ({placeholders})', list(sources))
+            conn.execute(f'DELETE FROM chunks WHERE source IN ({placeholders})', list(sources))
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute('DELETE FROM page_versions')
+            conn.execute('DELETE FROM chunks')
+
+
+dotenv.load_dotenv()
+page_index = PageIndex(os.getenv('PAGE_INDEX_DB', '.page_index.db'))
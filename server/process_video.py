@@ -1,10 +1,19 @@
+import hashlib
+import json
 import os
+import random
+import shutil
+import tempfile
 import time
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
 from io import BytesIO
 from dotenv import load_dotenv
 from google import genai
+from long_video import local_copy, probe_duration, split_video, stream_duration
 from pydantic import BaseModel
+from tracing import add_usage, in_context, span, traced
+from video_cache import hash_upload, video_cache
 
 
 # Define the JSON schema using Pydantic.
@@ -21,20 +30,72 @@ class VideoSummary(BaseModel):
     overall_summary: str    # An overall summary of the video's content.
     user_intention: str     # The user's intended code changes based on the video.
 
+class VideoOverview(BaseModel):
+    overall_summary: str
+    user_intention: str
+
 # Load environment variables and initialize the Gemini client.
 load_dotenv()
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 client = genai.Client(api_key=gemini_api_key)
-def upload_video(video):
-    video_file = client.files.upload(file=BytesIO(video.read()), config={"mime_type": "video/mp4"})
-    # Wait until the video file is processed.
+
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", 300))  # seconds to wait for Gemini to finish processing
+POLL_MAX_INTERVAL = float(os.getenv("UPLOAD_POLL_MAX_INTERVAL", 5))
+# Uploads still held in memory above this size are spilled to a temporary file first.
+UPLOAD_SPILL_BYTES = int(os.getenv("UPLOAD_SPILL_BYTES", 8 * 1024 * 1024))
+
+# Recordings longer than LONG_VIDEO_SECONDS are cut into windows and analyzed in parallel (0 disables).
+LONG_VIDEO_SECONDS = float(os.getenv("LONG_VIDEO_SECONDS", 300))
+LONG_VIDEO_WINDOW_SECONDS = float(os.getenv("LONG_VIDEO_WINDOW_SECONDS", 120))
+LONG_VIDEO_SCALE_HEIGHT = int(os.getenv("LONG_VIDEO_SCALE_HEIGHT", 720))  # 0 keeps the original resolution
+LONG_VIDEO_FPS = float(os.getenv("LONG_VIDEO_FPS", 0))                  # 0 keeps the original frame rate
+LONG_VIDEO_CONCURRENCY = int(os.getenv("LONG_VIDEO_CONCURRENCY", 4))
+
+
+def _is_in_memory(stream) -> bool:
+    if isinstance(stream, BytesIO):
+        return True
+    return isinstance(stream, tempfile.SpooledTemporaryFile) and not stream._rolled
+
+
+def _stream_size(stream) -> int:
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(0)
+    return size
+
+
+@traced("gemini_processing")
+def wait_until_processed(video_file, timeout: float = UPLOAD_TIMEOUT):
+    # Back off from 0.5s up to POLL_MAX_INTERVAL instead of polling at a fixed rate.
+    deadline = time.monotonic() + timeout
+    delay = 0.5
     while video_file.state.name == "PROCESSING":
-        print('.', end='')
-        time.sleep(0.5)
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"{video_file.name} was still processing after {timeout:.0f}s")
+        time.sleep(delay * random.uniform(0.8, 1.2))
+        delay = min(delay * 1.5, POLL_MAX_INTERVAL)
         video_file = client.files.get(name=video_file.name)
+    if video_file.state.name == "FAILED":
+        raise ValueError(f"Gemini failed to process {video_file.name}")
     return video_file
 
 
+def upload_video(video):
+    # Upload straight from Werkzeug's spooled file rather than copying it into a new buffer.
+    stream = video.stream
+    stream.seek(0)
+    if _is_in_memory(stream) and _stream_size(stream) > UPLOAD_SPILL_BYTES:
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as spilled:
+            shutil.copyfileobj(stream, spilled, 1024 * 1024)
+            spilled.flush()
+            with span("gemini_upload"):
+                video_file = client.files.upload(file=spilled.name, config={"mime_type": "video/mp4"})
+    else:
+        with span("gemini_upload"):
+            video_file = client.files.upload(file=stream, config={"mime_type": "video/mp4"})
+    return wait_until_processed(video_file)
+
+
 # Define a system prompt that sets the role and instructs the model to output JSON.
 system_prompt = (
     "System: You are a coding assistant specializing in debugging. Analyze the uploaded screen-recording video and extract "
@@ -107,19 +168,214 @@ user_prompt = (
 )
 
 
+REPLY_MODEL = "gemini-2.0-flash"
+# Cached analyses are only reused while the model, prompts and schema are unchanged.
+PROMPT_VERSION = hashlib.sha256(
+    "\n".join([REPLY_MODEL, system_prompt, user_prompt, json.dumps(VideoSummary.model_json_schema())]).encode()
+).hexdigest()[:16]
+
+
 # Call the Gemini API with the video file, system prompt, and user prompt.
 
+def _count_tokens(usage_metadata) -> None:
+    if usage_metadata is not None:
+        add_usage("gemini_input_tokens", usage_metadata.prompt_token_count or 0)
+        add_usage("gemini_output_tokens", usage_metadata.candidates_token_count or 0)
+
+
 def reply(video_file) -> VideoSummary:
 
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[video_file, system_prompt, user_prompt],
-        config={
-            'response_mime_type': 'application/json',
-            'response_schema': VideoSummary,
-        },
-    )
+    with span("gemini_generate"):
+        response = client.models.generate_content(
+            model=REPLY_MODEL,
+            contents=[video_file, system_prompt, user_prompt],
+            config={
+                'response_mime_type': 'application/json',
+                'response_schema': VideoSummary,
+            },
+        )
+    _count_tokens(getattr(response, "usage_metadata", None))
 
     # Print the structured JSON output.
     return response.parsed
 
+
+class SegmentStreamParser:
+    """
+    Incrementally scans a streamed VideoSummary JSON document and returns each
+    element of its top-level "segments" array as soon as the element is complete.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = 0
+        self.last_key = None        # last string seen directly inside the top-level object
+        self.in_segments = False
+        self.segment_start = None
+
+    def feed(self, text: str) -> list[VideoSummarySegment]:
+        self.buffer += text
+        segments = []
+        for i in range(self.pos, len(self.buffer)):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = self.buffer[self.string_start:i]
+            elif char == '"':
+                self.in_string = True
+                self.string_start = i + 1
+            elif char in "{[":
+                self.depth += 1
+                if char == "[" and self.depth == 2 and self.last_key == "segments":
+                    self.in_segments = True
+                elif char == "{" and self.depth == 3 and self.in_segments:
+                    self.segment_start = i
+            elif char in "}]":
+                if char == "}" and self.depth == 3 and self.segment_start is not None:
+                    raw = self.buffer[self.segment_start:i + 1]
+                    segments.append(VideoSummarySegment.model_validate_json(raw))
+                    self.segment_start = None
+                elif char == "]" and self.depth == 2:
+                    self.in_segments = False
+                self.depth -= 1
+        self.pos = len(self.buffer)
+        return segments
+
+
+def reply_stream(video_file, on_segment: Callable[[VideoSummarySegment], None]) -> VideoSummary:
+    """Like reply(), but streams the response and calls `on_segment` as each segment is parsed."""
+    parser = SegmentStreamParser()
+    usage_metadata = None
+    with span("gemini_generate"):
+        for chunk in client.models.generate_content_stream(
+            model=REPLY_MODEL,
+            contents=[video_file, system_prompt, user_prompt],
+            config={
+                'response_mime_type': 'application/json',
+                'response_schema': VideoSummary,
+            },
+        ):
+            # The totals arrive with the last chunk.
+            usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+            for segment in parser.feed(chunk.text or ""):
+                on_segment(segment)
+    _count_tokens(usage_metadata)
+    return VideoSummary.model_validate_json(parser.buffer)
+
+
+
+overview_prompt = (
+    "System: You are a coding assistant specializing in debugging. Below are the segments extracted from a "
+    "screen-recording of a debugging session, in order, as JSON. Write an overall summary of the session and "
+    "the user's intended code changes, in the same style as the per-window summaries that follow the segments."
+)
+
+
+def _analyze_window(start: float, path: str, on_segment) -> VideoSummary:
+    with span("gemini_upload"):
+        video_file = client.files.upload(file=path, config={"mime_type": "video/mp4"})
+    video_file = wait_until_processed(video_file)
+    try:
+        summary = reply(video_file)
+    finally:
+        client.files.delete(name=video_file.name)
+    for segment in summary.segments:
+        segment.start_timestamp += start
+        segment.end_timestamp += start
+        if on_segment:
+            on_segment(segment)
+    return summary
+
+
+def reply_long(path: str, duration: float, on_segment: Optional[Callable[[VideoSummarySegment], None]] = None) -> VideoSummary:
+    """
+    Analyzes a long recording window by window: the windows are cut locally,
+    analyzed concurrently, and their segments merged on the recording's timeline.
+    A final text-only pass writes overall_summary and user_intention.
+    """
+    with tempfile.TemporaryDirectory() as out_dir:
+        with span("video_split"):
+            windows = split_video(
+                path, duration, LONG_VIDEO_WINDOW_SECONDS, out_dir,
+                scale_height=LONG_VIDEO_SCALE_HEIGHT, fps=LONG_VIDEO_FPS, workers=LONG_VIDEO_CONCURRENCY,
+            )
+        print(f"Analyzing {duration:.0f}s recording as {len(windows)} windows")
+        with ThreadPoolExecutor(max_workers=LONG_VIDEO_CONCURRENCY) as pool:
+            futures = [pool.submit(in_context(_analyze_window), *window, on_segment) for window in windows]
+            partials = [future.result() for future in futures]
+
+    segments = sorted((segment for partial in partials for segment in partial.segments), key=lambda s: s.start_timestamp)
+    window_summaries = "\n\n".join(partial.overall_summary for partial in partials)
+    with span("gemini_generate"):
+        response = client.models.generate_content(
+            model=REPLY_MODEL,
+            contents=[overview_prompt, json.dumps([segment.model_dump() for segment in segments]), window_summaries],
+            config={
+                'response_mime_type': 'application/json',
+                'response_schema': VideoOverview,
+            },
+        )
+    _count_tokens(getattr(response, "usage_metadata", None))
+    overview = response.parsed
+    return VideoSummary(segments=segments, overall_summary=overview.overall_summary, user_intention=overview.user_intention)
+
+
+def _reuse_file(file_name: str):
+    try:
+        video_file = client.files.get(name=file_name)
+    except Exception as e:
+        print(f"Cached upload {file_name} is gone: {e}")
+        return None
+    return video_file if video_file.state.name == "ACTIVE" else None
+
+
+def _duration(stream) -> float:
+    """The recording's length from its MP4 header, or from ffmpeg if the upload is already a file on disk; 0 if unknown."""
+    duration = stream_duration(stream)
+    name = getattr(stream, 'name', None)
+    if duration is None and isinstance(name, str) and os.path.isfile(name):
+        duration = probe_duration(name)
+    return duration or 0
+
+
+def summarize_video(video, on_segment: Optional[Callable[[VideoSummarySegment], None]] = None) -> VideoSummary:
+    """
+    Uploads and analyzes a recording, reusing earlier results for identical bytes:
+    a cached VideoSummary is returned directly, and a still-valid Gemini upload
+    skips the upload and processing wait. With `on_segment`, the analysis is
+    streamed and each segment is passed on as soon as it is parsed; it is not
+    called for cached results.
+    """
+    key = f"{hash_upload(video.stream)}:{PROMPT_VERSION}"
+    cached = video_cache.get(key)
+    if cached and cached.summary_json:
+        print("Video summary cache hit")
+        return VideoSummary.model_validate_json(cached.summary_json)
+
+    duration = _duration(video.stream) if LONG_VIDEO_SECONDS else 0
+    if duration > LONG_VIDEO_SECONDS:
+        # Only recordings known to be long are copied to disk for splitting.
+        with local_copy(video.stream) as path:
+            summary = reply_long(path, duration, on_segment)
+        video_cache.put_summary(key, summary.model_dump_json())
+        return summary
+
+    video_file = _reuse_file(cached.file_name) if cached and cached.file_valid else None
+    if video_file is None:
+        video_file = upload_video(video)
+        expires_at = video_file.expiration_time.timestamp() if video_file.expiration_time else None
+        video_cache.put_file(key, video_file.name, expires_at)
+
+    summary = reply_stream(video_file, on_segment) if on_segment else reply(video_file)
+    video_cache.put_summary(key, summary.model_dump_json())
+    return summary
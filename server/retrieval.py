@@ -0,0 +1,133 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+from clients import get_embeddings, vector_store
+from langchain.docstore.document import Document
+from page_index import content_hash, page_index
+from scrape import get_k_most_relevant
+from scrape_cache import normalize_url
+from tracing import span
+
+# 'hybrid' scopes retrieval to the session's URLs and fuses BM25 with vector search; 'vector' is the plain similarity search.
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')
+CANDIDATES_PER_RANKER = int(os.getenv('RETRIEVAL_CANDIDATES', 50))
+# Optional sentence-transformers cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2.
+RERANK_MODEL = os.getenv('RETRIEVAL_RERANK_MODEL', '')
+RRF_K = 60
+
+# Identifiers (max_tokens), dotted names and keyword arguments (stream=True) are kept whole.
+_TOKEN = re.compile(r"[a-z_][a-z0-9_]*(?:\.[a-z_][a-z0-9_]*)*(?:=[a-z0-9_\"']+)?|\d+")
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[.=\"']+", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class BM25Index:
+    """Inverted index over a small set of chunks, scored with Okapi BM25."""
+
+    def __init__(self, texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self.lengths = []
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+
+    def search(self, query: str, k: int) -> list[tuple[int, float]]:
+        scores: dict[int, float] = defaultdict(float)
+        n = len(self.lengths)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term, [])
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.average_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def _rerank(query: str, docs: list[Document]) -> list[tuple[Document, float]]:
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            from sentence_transformers import CrossEncoder
+            _reranker = CrossEncoder(RERANK_MODEL)
+    scores = _reranker.predict([(query, doc.page_content) for doc in docs])
+    return sorted(zip(docs, map(float, scores)), key=lambda item: item[1], reverse=True)
+
+
+def vector_search(query: str, sources: list[str], k: int) -> list[tuple[Document, float]]:
+    """
+    The k chunks closest to the query from the given pages, as (document, distance).
+    langchain_iris turns a metadata filter into a LIKE on the JSON-encoded metadata,
+    which can only express equality, so each page is searched on its own and the
+    hits are merged by distance.
+    """
+    embedding = get_embeddings().embed_query(query)
+    hits = []
+    with vector_store() as db:
+        for source in sources:
+            hits.extend(
+                (doc, distance)
+                for doc, distance in db.similarity_search_with_score_by_vector(embedding, k, filter={'source': source})
+                if doc.metadata.get('source') == source  # LIKE reads _ and % in the URL as wildcards
+            )
+    return sorted(hits, key=lambda hit: hit[1])[:k]
+
+
+def hybrid_search(query: str, sources: list[str], k: int) -> list[tuple[Document, float]]:
+    """
+    Retrieves the k best chunks from the given pages by fusing BM25 and vector
+    rankings with reciprocal rank fusion, optionally reranked by a cross-encoder.
+    Scores are fused (or reranker) scores: higher is better. Sources are matched
+    by their normalized URL, the key ingestion stores pages under.
+    """
+    sources = list(dict.fromkeys(map(normalize_url, sources)))
+    with span('vector_search'):
+        vector_hits = vector_search(query, sources, CANDIDATES_PER_RANKER)
+
+    with span('bm25'):
+        chunks = page_index.chunks_for(sources)
+        bm25 = BM25Index([text for _, _, text in chunks])
+        lexical_hits = [
+            Document(page_content=chunks[i][2], metadata={'source': chunks[i][1]})
+            for i, _ in bm25.search(query, CANDIDATES_PER_RANKER)
+        ]
+
+    fused: dict[str, float] = defaultdict(float)
+    docs: dict[str, Document] = {}
+    for ranking in ([doc for doc, _ in vector_hits], lexical_hits):
+        for rank, doc in enumerate(ranking):
+            key = content_hash(doc.page_content)
+            docs.setdefault(key, doc)
+            fused[key] += 1 / (RRF_K + rank + 1)
+    ranked = sorted(fused, key=fused.get, reverse=True)
+
+    if RERANK_MODEL:
+        with span('rerank'):
+            return _rerank(query, [docs[key] for key in ranked[:CANDIDATES_PER_RANKER]])[:k]
+    return [(docs[key], fused[key]) for key in ranked[:k]]
+
+
+def retrieve(query: str, sources: list[str], k: int) -> list[tuple[Document, float]]:
+    if RETRIEVAL_MODE == 'hybrid' and sources:
+        return hybrid_search(query, sources, k)
+    return get_k_most_relevant(query, k)
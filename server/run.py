@@ -1,72 +1,114 @@
-from flask import Flask, jsonify, request
+import json
+import os
+import tempfile
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+from context import assemble_instructions
 from flask_cors import CORS, cross_origin  # Import CORS handling
+from ingest import Ingestor
+from jobs import job_runner
 from langchain.docstore.document import Document
-from markdownify import markdownify as md
-from process_video import VideoSummary, VideoSummarySegment, reply, upload_video
-from scrape import chunk_and_store_markdown, get_html, get_k_most_relevant
+from maintenance import collection_stats
+from process_video import VideoSummary, summarize_video
+from retrieval import retrieve
+from tracing import instrument, span
+from werkzeug.datastructures import FileStorage
 
 app = Flask(__name__)
 CORS(app)
+instrument(app)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
 
-def format_segment(segment: VideoSummarySegment) -> str:
-    return f"""\
-{segment.user_speech}
-
-Screen Events: {segment.screen_events}
-Visited Files: {segment.active_files}
-Visited URLs: {segment.visited_urls}
-"""
-
-def format_segments(segments: list[VideoSummarySegment]) -> str:
-    return '\n'.join([format_segment(segment) for segment in segments])
-
-def format_doc(doc: Document) -> str:
-    return f"""\
-{doc.page_content}
-
-URL: {doc.metadata['source']}
-"""
-
-def format_docs(docs: list[Document]) -> str:
-    return '\n'.join([format_doc(doc) for doc in docs])
-
 def format_instructions(summary: VideoSummary, docs: list[Document]) -> str:
-    return f"""\
-Intention: {summary.user_intention}
-
-Summary: {summary.overall_summary}
-
-Segments: 
-{format_segments(summary.segments)}
-
-Docs: 
-{format_docs(docs)}
-"""
+    return assemble_instructions(summary, docs)
+
+
+def run_pipeline(video, emit=lambda stage, data=None: None) -> str:
+    # URLs are handed to ingestion while the video analysis is still streaming in.
+    ingestor = Ingestor(on_result=lambda url, outcome: emit('url_ingested', {'url': url, 'outcome': outcome}))
+    with span('video'):
+        response = summarize_video(video, on_segment=lambda segment: ingestor.submit(segment.visited_urls))
+    emit('video_summary', response.model_dump())
+    # Catches cached summaries, which aren't streamed; already submitted URLs are skipped.
+    urls = [url for snapshot in response.segments for url in snapshot.visited_urls]
+    ingestor.submit(urls)
+    with span('ingest_wait'):
+        ingestor.wait()
+    query = response.user_intention
+    with span('retrieve'):
+        docs_with_score = retrieve(query, urls, 20)
+    docs = [doc[0] for doc in docs_with_score]
+    with span('assemble'):
+        instructions = format_instructions(response, docs)
+    emit('instructions', {'response': instructions})
+    return instructions
 
 
 @app.route('/respond', methods=['POST'])
 def respond():
     print('Received request for /respond')
     video = request.files['video']
-    video = upload_video(video)
-    response = reply(video)
-    urls = set()
-    for snapshot in response.segments:
-        for url in snapshot.visited_urls:
-            urls.add(url)
-
-    for url in urls:
-        html = get_html(url)
-        markdown = md(html)
-        chunk_and_store_markdown(url, markdown)
-    query = response.user_intention
-    docs_with_score = get_k_most_relevant(query, 20)
-    docs = [doc[0] for doc in docs_with_score]
-    instructions = format_instructions(response, docs)
+    instructions = run_pipeline(video)
     return jsonify({"response": instructions}), 200
 
 
+def _run_pipeline_job(path: str, filename: str, emit) -> dict:
+    with open(path, 'rb') as stream:
+        instructions = run_pipeline(FileStorage(stream=stream, filename=filename), emit)
+    return {"response": instructions}
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    print('Received request for /jobs')
+    video = request.files['video']
+    # The upload is gone once this request returns, so keep a copy for the worker.
+    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
+        video.save(f)
+    job = job_runner.submit(_run_pipeline_job, f.name, video.filename, on_finish=lambda: os.remove(f.name))
+    return jsonify({
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def events():
+        sent = 0
+        while True:
+            new_events = job.wait_for_events(sent, timeout=15)
+            for event in new_events:
+                yield f"event: {event['stage']}\ndata: {json.dumps(event['data'])}\n\n"
+            sent += len(new_events)
+            if job.finished and sent == len(job.events):
+                yield f"event: {job.status}\ndata: {json.dumps({'error': job.error})}\n\n"
+                return
+            if not new_events:
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream')
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    limit = request.args.get('limit', default=100, type=int)
+    return jsonify(collection_stats(limit)), 200
+
+
 @app.route('/test', methods=['GET'])
 def test():
     return jsonify({"message": "Hello, World!"}), 200
@@ -1,16 +1,21 @@
 import argparse
 import os
+import threading
 from typing import Literal
 
 import dotenv
-import openai
+from chunking import CHUNK_MAX_CHARS, CHUNKER_VERSION, chunk_markdown
+from clients import get_embeddings, vector_store
 from langchain.docstore.document import Document
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_iris import IRISVector
-from langchain_openai import OpenAIEmbeddings
+from maintenance import flush
 from markdownify import markdownify as md
+import requests
 from pydantic import BaseModel
+from page_index import chunk_id, content_hash, page_index
+from scrape_cache import scrape_cache
 from scrapingbee import ScrapingBeeClient
+from summaries import get_summary
+from tracing import add_usage, span
 
 
 class PageContent:
@@ -22,81 +27,137 @@ class PageContent:
 
 dotenv.load_dotenv()
 
-def get_html(url: str) -> str:
+# ScrapingBee renders in flight at once, across all requests.
+RENDER_LIMIT = threading.BoundedSemaphore(int(os.getenv('SCRAPE_CONCURRENCY', 5)))
+
+def render_html(url: str) -> requests.Response:
     scrapingbee_api_key = os.getenv('SCRAPINGBEE_API_KEY')
     if not scrapingbee_api_key:
         raise ValueError("SCRAPINGBEE_API_KEY is not set")
     client = ScrapingBeeClient(api_key=scrapingbee_api_key)
 
-    response = client.get(url, params={
-      'wait': 40,
-      'wait_browser': 'networkidle0',
-      'block_resources': False
-    })
-    return response.text
-
-def connection_string() -> str:
-    username = 'demo'
-    password = 'demo'   
-    hostname = os.getenv('IRIS_HOSTNAME', 'localhost')
-    port = '1972' 
-    namespace = 'USER'
-    return f"iris://{username}:{password}@{hostname}:{port}/{namespace}"
-
-def chunk_and_store_markdown(url: str, markdown: str) -> None:
-    openai_client = openai.Client()
-    completion = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant who takes in a URL and returns a brief description of what the page is likely about."},
-            {"role": "user", "content": f"What is the page located at {url} about?"}
-        ]
+    with RENDER_LIMIT, span('scrape_render'):
+        add_usage('scrapingbee_renders')
+        response = client.get(url, params={
+          'wait': 40,
+          'wait_browser': 'networkidle0',
+          'block_resources': False
+        })
+    # Quota, auth and origin errors come back as error bodies; never cache or index those as page content.
+    response.raise_for_status()
+    return response
+
+def revalidate(url: str, etag: str | None, last_modified: str | None) -> bool:
+    """Asks the origin whether the cached render is still current (HTTP 304)."""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    if not headers:
+        return False
+    try:
+        with requests.get(url, headers=headers, timeout=10, stream=True) as response:
+            return response.status_code == 304
+    except requests.RequestException:
+        return False
+
+def fetch_page(url: str) -> tuple[str, str]:
+    """Returns the rendered HTML and its markdown, served from the scrape cache when possible."""
+    cached = scrape_cache.get(url)
+    if cached:
+        if cached.fresh:
+            add_usage('scrape_cache_hits')
+            return cached.html, cached.markdown
+        if revalidate(url, cached.etag, cached.last_modified):
+            add_usage('scrape_revalidations')
+            scrape_cache.mark_fresh(url)
+            return cached.html, cached.markdown
+
+    response = render_html(url)
+    html = response.text
+    markdown = md(html)
+    # ScrapingBee forwards the origin's headers with a "Spb-" prefix.
+    headers = response.headers
+    scrape_cache.put(
+        url, html, markdown,
+        etag=headers.get('Spb-ETag') or headers.get('ETag'),
+        last_modified=headers.get('Spb-Last-Modified') or headers.get('Last-Modified'),
     )
-    summary = completion.choices[0].message.content
-    text_splitter = CharacterTextSplitter(chunk_size=2000, chunk_overlap=500)
-    docs = text_splitter.split_documents([Document(page_content=markdown, metadata={'source': url})])
-    for doc in docs:
-        doc.page_content = f"""\
-Page Context: 
-{url}
-{summary}
+    return html, markdown
 
-Chunk Content:
-{doc.page_content}
-"""
-    embeddings = OpenAIEmbeddings()
-    db = IRISVector(
-        dimension=1536,
-        embedding_function=embeddings,
-        collection_name='documentation',
-        connection_string=connection_string()
-    )
-    db.add_documents(docs)
-    print(f"Number of docs in vector store: {len(db.get()['ids'])}")
+def get_html(url: str) -> str:
+    return fetch_page(url)[0]
+
+def get_markdown(url: str) -> str:
+    return fetch_page(url)[1]
+
+# Serializes re-ingestion of the same page so concurrent requests don't race on its chunk ids.
+_page_locks: dict[str, threading.Lock] = {}
+_page_locks_guard = threading.Lock()
+
+def _page_lock(url: str) -> threading.Lock:
+    with _page_locks_guard:
+        return _page_locks.setdefault(url, threading.Lock())
+
+def page_version(markdown: str) -> str:
+    """Version of a page's indexed chunks: changes with the content and with how it is chunked."""
+    return content_hash(f"chunker {CHUNKER_VERSION} max_chars {CHUNK_MAX_CHARS}\n{markdown}")
+
+def is_page_current(url: str, markdown: str) -> bool:
+    record = page_index.get(url)
+    return record is not None and record.version == page_version(markdown)
+
+def store_markdown(url: str, markdown: str, summary: str) -> None:
+    with _page_lock(url):
+        record = page_index.get(url)
+        version = page_version(markdown)
+        if record and record.version == version:
+            print(f"{url} is unchanged, skipping")
+            return
+
+        docs, ids = [], []
+        for doc in chunk_markdown(url, markdown, summary):
+            doc_id = chunk_id(url, doc.page_content)
+            if doc_id in ids:
+                continue
+            docs.append(doc)
+            ids.append(doc_id)
+
+        old_ids = set(record.chunk_ids) if record else set()
+        new = [(doc, doc_id) for doc, doc_id in zip(docs, ids) if doc_id not in old_ids]
+        stale = list(old_ids - set(ids))
+
+        # Embed before checking out a connection, so a store isn't held while the
+        # embedding scheduler batches these chunks with other pages'.
+        texts = [doc.page_content for doc, _ in new]
+        embeddings = get_embeddings().embed_documents(texts) if new else []
+        with span('vector_write'), vector_store() as db:
+            if new:
+                db.add_embeddings(
+                    texts, embeddings, metadatas=[doc.metadata for doc, _ in new], ids=[doc_id for _, doc_id in new]
+                )
+            if stale:
+                db.delete(stale)
+            page_index.put(url, version, {doc_id: doc.page_content for doc, doc_id in zip(docs, ids)})
+            print(f"{url}: {len(new)} chunks added, {len(stale)} removed, {len(ids) - len(new)} unchanged")
+
+def chunk_and_store_markdown(url: str, markdown: str) -> None:
+    if is_page_current(url, markdown):
+        return
+    store_markdown(url, markdown, get_summary(url, content_hash(markdown)))
 
     
 def flush_database():
-    db = IRISVector(
-        dimension=1536,
-        collection_name='documentation',
-        connection_string=connection_string(),
-        embedding_function=OpenAIEmbeddings()
-    )
-    db.delete(db.get()['ids'])
+    flush()
 
 def scrape_website(url: str) -> None:
-    html = get_html(url)
-    markdown = md(html)
+    markdown = get_markdown(url)
     chunk_and_store_markdown(url, markdown)
 
 def get_k_most_relevant(query: str, k: int) -> list[tuple[Document, float]]:
-    db = IRISVector(
-        dimension=1536,
-        collection_name='documentation',
-        connection_string=connection_string(),
-        embedding_function=OpenAIEmbeddings()
-    )
-    docs_with_score = db.similarity_search_with_score(query, k)
+    with vector_store() as db:
+        docs_with_score = db.similarity_search_with_score(query, k)
     return docs_with_score
 
 """
@@ -131,8 +192,7 @@ def main():
         'https://docs.anthropic.com/en/api/getting-started',
     ]
     for i, url in enumerate(urls):
-        html = get_html(url)
-        markdown = md(html)
+        markdown = get_markdown(url)
         with open(f'doc_{i}.md', 'w') as f:
             f.write(markdown)
         chunk_and_store_markdown(url, markdown)
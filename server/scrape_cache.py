@@ -0,0 +1,159 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import dotenv
+
+
+@dataclass
+class CachedPage:
+    url: str
+    html: str
+    markdown: str
+    content_hash: str
+    fetched_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh: bool  # still within the domain's TTL
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or 'https'
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.startswith('utm_'))
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def parse_ttls(spec: str) -> dict[str, float]:
+    """Parses 'docs.anthropic.com=604800,platform.openai.com=86400' into a domain -> seconds map."""
+    ttls = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        domain, _, seconds = item.partition('=')
+        ttls[domain.strip().lower()] = float(seconds)
+    return ttls
+
+
+class ScrapeCache:
+    """
+    On-disk cache of rendered pages. Entries are keyed by normalized URL and point
+    at content-addressed blobs, so identical pages served from several URLs are
+    stored once. Least recently used entries are evicted past `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int, default_ttl: float, domain_ttls: dict[str, float]):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.domain_ttls = domain_ttls
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT
+                )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(os.path.join(self.root, 'index.db'), timeout=30)
+
+    def _blob_path(self, content_hash: str, ext: str) -> str:
+        return os.path.join(self.root, 'blobs', f"{content_hash}.{ext}")
+
+    def ttl_for(self, url: str) -> float:
+        host = (urlsplit(url).hostname or '').lower()
+        for domain, ttl in self.domain_ttls.items():
+            if host == domain or host.endswith('.' + domain):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        key = _key(url)
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT url, content_hash, fetched_at, etag, last_modified FROM pages WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE pages SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        cached_url, content_hash, fetched_at, etag, last_modified = row
+        try:
+            with open(self._blob_path(content_hash, 'html'), encoding='utf-8') as f:
+                html = f.read()
+            with open(self._blob_path(content_hash, 'md'), encoding='utf-8') as f:
+                markdown = f.read()
+        except FileNotFoundError:
+            return None
+        fresh = time.time() - fetched_at < self.ttl_for(cached_url)
+        return CachedPage(cached_url, html, markdown, content_hash, fetched_at, etag, last_modified, fresh)
+
+    def put(self, url: str, html: str, markdown: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        content_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+        for ext, text in (('html', html), ('md', markdown)):
+            path = self._blob_path(content_hash, ext)
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_path, path)
+        size = len(html.encode('utf-8')) + len(markdown.encode('utf-8'))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (_key(url), normalize_url(url), content_hash, size, now, now, etag, last_modified),
+            )
+        self.evict()
+
+    def mark_fresh(self, url: str) -> None:
+        with self._connect() as conn:
+            conn.execute('UPDATE pages SET fetched_at = ? WHERE key = ?', (time.time(), _key(url)))
+
+    def evict(self) -> None:
+        with self._lock, self._connect() as conn:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, content_hash, size in conn.execute(
+                'SELECT key, content_hash, size FROM pages ORDER BY accessed_at'
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM pages WHERE key = ?', (key,))
+                total -= size
+                still_used = conn.execute('SELECT 1 FROM pages WHERE content_hash = ?', (content_hash,)).fetchone()
+                if not still_used:
+                    for ext in ('html', 'md'):
+                        try:
+                            os.remove(self._blob_path(content_hash, ext))
+                        except FileNotFoundError:
+                            pass
+
+
+def _key(url: str) -> str:
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+dotenv.load_dotenv()
+scrape_cache = ScrapeCache(
+    root=os.getenv('SCRAPE_CACHE_DIR', '.scrape_cache'),
+    max_bytes=int(os.getenv('SCRAPE_CACHE_MAX_BYTES', 500 * 1024 * 1024)),
+    default_ttl=float(os.getenv('SCRAPE_CACHE_TTL', 24 * 60 * 60)),
+    domain_ttls=parse_ttls(os.getenv('SCRAPE_CACHE_TTLS', '')),
+)
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import time
+
+import dotenv
+from clients import get_openai_client
+from tracing import add_usage, traced
+
+dotenv.load_dotenv()
+
+
+@traced('page_summary')
+def summarize_page(url: str) -> str:
+    openai_client = get_openai_client()
+    completion = openai_client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant who takes in a URL and returns a brief description of what the page is likely about."},
+            {"role": "user", "content": f"What is the page located at {url} about?"}
+        ]
+    )
+    add_usage('openai_input_tokens', completion.usage.prompt_tokens)
+    add_usage('openai_output_tokens', completion.usage.completion_tokens)
+    return completion.choices[0].message.content
+
+
+class SummaryStore:
+    """Page summaries keyed by URL and page version, evicted least recently used past `max_entries`."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    url TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    accessed_at REAL NOT NULL
+                )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, urls: list[str]) -> dict[str, tuple[str, str]]:
+        """Returns {url: (version, summary)} for every known URL, in a single query."""
+        urls = list(urls)
+        if not urls:
+            return {}
+        placeholders = ', '.join('?' * len(urls))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f'SELECT url, version, summary FROM summaries WHERE url IN ({placeholders})', urls
+            ).fetchall()
+            conn.execute(f'UPDATE summaries SET accessed_at = ? WHERE url IN ({placeholders})', [time.time(), *urls])
+        return {url: (version, summary) for url, version, summary in rows}
+
+    def put(self, url: str, version: str, summary: str) -> None:
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)', (url, version, summary, time.time()))
+            conn.execute("""
+                DELETE FROM summaries WHERE url IN (
+                    SELECT url FROM summaries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""", (self.max_entries,))
+
+
+summary_store = SummaryStore(
+    os.getenv('SUMMARY_DB', '.summaries.db'),
+    int(os.getenv('SUMMARY_CACHE_MAX_ENTRIES', 10000)),
+)
+
+
+def get_summary(url: str, version: str) -> str:
+    """Returns the summary for this version of the page, generating it only if it isn't stored yet."""
+    cached = summary_store.lookup([url]).get(url)
+    if cached and cached[0] == version:
+        return cached[1]
+    summary = summarize_page(url)
+    summary_store.put(url, version, summary)
+    return summary
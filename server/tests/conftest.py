@@ -0,0 +1,13 @@
+"""
+Run from server/: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import configure_environment  # noqa: E402
+
+# The server modules open their stores at import time, so point them somewhere disposable first.
+configure_environment(tempfile.mkdtemp(prefix='codefusion-tests-'))
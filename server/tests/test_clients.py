@@ -0,0 +1,44 @@
+import clients
+import pytest
+import run
+import sqlalchemy
+
+
+class SQLiteStore:
+    """Uses its connection the way IRISVector does: writes run in `with _conn.begin():`."""
+
+    def __init__(self):
+        self._conn = sqlalchemy.create_engine('sqlite://').connect()
+        with self._conn.begin():
+            self._conn.execute(sqlalchemy.text(f'CREATE TABLE {clients.COLLECTION_NAME} (id TEXT PRIMARY KEY)'))
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None, **kwargs):
+        with self._conn.begin():
+            for chunk_id in ids:
+                self._conn.execute(sqlalchemy.text(f'INSERT INTO {clients.COLLECTION_NAME} VALUES (:id)'), {'id': chunk_id})
+        return ids
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = SQLiteStore()
+    monkeypatch.setattr(clients, 'VECTOR_BACKEND', 'iris')
+    monkeypatch.setattr(clients, '_pool', clients.VectorStorePool(1))
+    monkeypatch.setattr(clients, '_create_store', lambda: store)
+    return store
+
+
+def test_stats_leave_the_pooled_store_writable(store):
+    client = run.app.test_client()
+    assert client.get('/stats').get_json()['vectors'] == 0
+
+    with clients.vector_store() as db:
+        assert db is store
+        db.add_embeddings(['text'], [[0.0]], ids=['chunk-1'])
+
+    assert client.get('/stats').get_json()['vectors'] == 1
+
+
+def test_health_check_leaves_the_store_writable(store):
+    assert clients._is_healthy(store)
+    store.add_embeddings(['text'], [[0.0]], ids=['chunk-1'])
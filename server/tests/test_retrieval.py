@@ -0,0 +1,101 @@
+import json
+import re
+from contextlib import nullcontext
+
+import numpy as np
+import pytest
+import retrieval
+from benchmark import hashed_embedding
+from langchain.docstore.document import Document
+
+DIMENSION = 64
+PAGE = 'https://docs.example/api_reference'
+OTHER_PAGE = 'https://docs.example/streaming'
+LOOKALIKE = 'https://docs.example/apiXreference'  # matches PAGE's LIKE pattern, as _ is a wildcard
+
+
+def _like(value: str, pattern: str) -> bool:
+    regex = ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern)
+    return re.fullmatch(regex, value, re.DOTALL) is not None
+
+
+class IRISFilterStore:
+    """
+    Stands in for IRISVector with its filter semantics: langchain_iris turns each
+    filter key/value pair into `metadata LIKE '%"key": <json value>%'` on the
+    JSON-encoded metadata column.
+    """
+
+    def __init__(self, rows: list[tuple[str, dict]]):
+        self.rows = [(text, json.dumps(metadata), np.array(hashed_embedding(text, DIMENSION))) for text, metadata in rows]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None):
+        patterns = ['%' + json.dumps({key: value})[1:-1] + '%' for key, value in (filter or {}).items()]
+        query = np.array(embedding)
+        hits = []
+        for text, metadata, vector in self.rows:
+            if all(_like(metadata, pattern) for pattern in patterns):
+                similarity = float(vector @ query) / (float(np.linalg.norm(vector) * np.linalg.norm(query)) or 1.0)
+                hits.append((Document(page_content=text, metadata=json.loads(metadata)), 1 - similarity))
+        return sorted(hits, key=lambda hit: hit[1])[:k]
+
+
+class FakeEmbeddings:
+    def embed_query(self, text: str) -> list[float]:
+        return hashed_embedding(text, DIMENSION)
+
+
+class EmptyPageIndex:
+    """No chunk texts, so BM25 finds nothing and every hybrid result comes from vector search."""
+
+    def chunks_for(self, sources):
+        return []
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = IRISFilterStore([
+        ('stream tokens with stream=True', {'source': PAGE}),
+        ('set max_tokens to limit the output', {'source': PAGE}),
+        ('stream responses as server sent events', {'source': OTHER_PAGE}),
+        ('stream tokens with stream=True and more', {'source': LOOKALIKE}),
+        ('stream tokens from another site', {'source': 'https://elsewhere.example/'}),
+    ])
+    monkeypatch.setattr(retrieval, 'vector_store', lambda: nullcontext(store))
+    monkeypatch.setattr(retrieval, 'get_embeddings', FakeEmbeddings)
+    monkeypatch.setattr(retrieval, 'page_index', EmptyPageIndex())
+    monkeypatch.setattr(retrieval, 'RERANK_MODEL', '')
+    return store
+
+
+def test_iris_filters_cannot_express_in(store):
+    embedding = hashed_embedding('stream tokens', DIMENSION)
+    assert store.similarity_search_with_score_by_vector(embedding, 10, filter={'source': {'$in': [PAGE]}}) == []
+
+
+def test_vector_search_covers_every_source(store):
+    hits = retrieval.vector_search('stream tokens', [PAGE, OTHER_PAGE], 10)
+
+    assert sorted(doc.metadata['source'] for doc, _ in hits) == [PAGE, PAGE, OTHER_PAGE]
+    distances = [distance for _, distance in hits]
+    assert distances == sorted(distances)
+
+
+def test_vector_search_keeps_the_k_closest(store):
+    hits = retrieval.vector_search('stream tokens', [PAGE, OTHER_PAGE], 1)
+
+    assert [(doc.page_content, doc.metadata['source']) for doc, _ in hits] == [('stream tokens with stream=True', PAGE)]
+
+
+def test_hybrid_search_returns_vector_hits(store):
+    results = retrieval.hybrid_search('stream tokens', [PAGE, OTHER_PAGE], 3)
+
+    assert len(results) == 3
+    assert {doc.metadata['source'] for doc, _ in results} == {PAGE, OTHER_PAGE}
+
+
+def test_hybrid_search_matches_pages_by_normalized_url(store):
+    # Gemini reports URLs as visited; ingestion and the crawler store them normalized.
+    results = retrieval.hybrid_search('stream tokens', [PAGE + '/?utm_source=video#streaming'], 3)
+
+    assert {doc.metadata['source'] for doc, _ in results} == {PAGE}
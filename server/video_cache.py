@@ -0,0 +1,89 @@
+import hashlib
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@dataclass
+class CachedVideo:
+    summary_json: str | None  # parsed VideoSummary, once reply() has succeeded
+    file_name: str | None     # Gemini file handle of the uploaded recording
+    file_expires_at: float | None
+
+    @property
+    def file_valid(self) -> bool:
+        # Leave a minute of slack so the file doesn't expire mid-generation.
+        return self.file_name is not None and (self.file_expires_at or 0) > time.time() + 60
+
+
+def hash_upload(stream) -> str:
+    """SHA-256 of an uploaded file, read in chunks; leaves the stream rewound."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class VideoCache:
+    """Video analysis results keyed by recording hash and prompt/model version, evicted LRU past `max_entries`."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    key TEXT PRIMARY KEY,
+                    summary TEXT,
+                    file_name TEXT,
+                    file_expires_at REAL,
+                    accessed_at REAL NOT NULL
+                )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> CachedVideo | None:
+        with self._connect() as conn:
+            row = conn.execute('SELECT summary, file_name, file_expires_at FROM videos WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE videos SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return CachedVideo(*row)
+
+    def put_file(self, key: str, file_name: str, expires_at: float | None) -> None:
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO videos (key, file_name, file_expires_at, accessed_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET file_name = excluded.file_name,
+                    file_expires_at = excluded.file_expires_at, accessed_at = excluded.accessed_at
+                """, (key, file_name, expires_at, time.time()))
+            self._evict(conn)
+
+    def put_summary(self, key: str, summary_json: str) -> None:
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO videos (key, summary, accessed_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET summary = excluded.summary, accessed_at = excluded.accessed_at
+                """, (key, summary_json, time.time()))
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            DELETE FROM videos WHERE key IN (
+                SELECT key FROM videos ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )""", (self.max_entries,))
+
+
+video_cache = VideoCache(
+    os.getenv('VIDEO_CACHE_DB', '.video_cache.db'),
+    int(os.getenv('VIDEO_CACHE_MAX_ENTRIES', 500)),
+)